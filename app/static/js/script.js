@@ -29,21 +29,24 @@ document.addEventListener("DOMContentLoaded", function () {
         let content = "";
 
         if (data.patient_data) {
+          // Coded fields arrive as (possibly empty) lists
+          const joinList = (values) =>
+            values && values.length ? values.join(", ") : "N/A";
           content += `<h3>Patient Information:</h3>`;
           content += `<div>Age: ${data.patient_data.age || "N/A"}</div>`;
           content += `<div>Gender: ${data.patient_data.gender || "N/A"}</div>`;
-          content += `<div>Medications: ${
-            data.patient_data.medications || "N/A"
-          }</div>`;
-          content += `<div>Allergies: ${
-            data.patient_data.allergies || "N/A"
-          }</div>`;
-          content += `<div>Conditions: ${
-            data.patient_data.conditions || "N/A"
-          }</div>`;
-          content += `<div>Social History: ${
-            data.patient_data.social_history || "N/A"
-          }</div>`;
+          content += `<div>Medications: ${joinList(
+            data.patient_data.medications
+          )}</div>`;
+          content += `<div>Allergies: ${joinList(
+            data.patient_data.allergies
+          )}</div>`;
+          content += `<div>Conditions: ${joinList(
+            data.patient_data.conditions
+          )}</div>`;
+          content += `<div>Social History: ${joinList(
+            data.patient_data.social_history
+          )}</div>`;
         }
         if (data.openai_response) {
           let converter = new showdown.Converter();
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Request latency with debug logging disabled, with the old synchronous full-body logging,
+and with the queued, redacting pipeline from utils/logging_setup.py.
+
+Each request logs four FHIR bundles, like /handle-fhir-id does. Run from the repo root:
+
+    python benchmarks/logging_latency.py [--requests 200] [--bundle-kb 1024]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, current_app, jsonify
+from flask.logging import default_handler
+from utils.logging_setup import configure_logging, log_payload, stop_logging
+
+RESOURCE_TYPES = ('MedicationRequest', 'AllergyIntolerance', 'Condition', 'Observation')
+
+
+def make_bundle(size_kb):
+    entry = ('<entry><resource><Condition><id value="e1"/><meta><lastUpdated value="2024-01-01T00:00:00Z"/></meta>'
+             '<subject><display value="Jane Doe"/></subject><birthDate value="1970-01-01"/>'
+             '<code><text value="Type 2 diabetes mellitus"/></code></Condition></resource></entry>')
+    count = max(1, size_kb * 1024 // len(entry))
+    return '<Bundle xmlns="http://hl7.org/fhir">' + entry * count + '</Bundle>'
+
+
+def make_app(mode, bundle, log_path):
+    app = Flask(__name__)
+    app.config.update(LOG_JSON=True, LOG_QUEUE_SIZE=10000)
+
+    if mode == 'sync':
+        # What the app did before: full bodies written synchronously on the request thread
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(logging.FileHandler(log_path))
+        app.logger.setLevel(logging.DEBUG)
+    elif mode == 'async':
+        configure_logging(app, [logging.FileHandler(log_path)])
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        app.logger.removeHandler(default_handler)
+        app.logger.setLevel(logging.INFO)
+
+    @app.route('/handle-fhir-id', methods=['POST'])
+    def handle_fhir_id():
+        for resource_type in RESOURCE_TYPES:
+            if mode == 'sync':
+                current_app.logger.debug(f"{resource_type} API Response: {bundle}")
+            else:
+                log_payload(current_app.logger, f"{resource_type} API Response", bundle, resource_type=resource_type)
+        return jsonify({'ok': True})
+
+    return app
+
+
+def run(mode, requests, bundle):
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'app.log')
+        app = make_app(mode, bundle, log_path)
+        client = app.test_client()
+        client.post('/handle-fhir-id', json={'fhirId': 'warmup'})
+
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.post('/handle-fhir-id', json={'fhirId': 'abc'})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        stop_logging()
+        for handler in list(app.logger.handlers):
+            app.logger.removeHandler(handler)
+            handler.close()
+        for handler in list(logging.getLogger().handlers):
+            logging.getLogger().removeHandler(handler)
+        log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+
+    latencies.sort()
+    return {
+        'median': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+        'log_kb': log_size / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--bundle-kb', type=int, default=1024)
+    args = parser.parse_args()
+
+    bundle = make_bundle(args.bundle_kb)
+    print(f"{args.requests} requests, 4 x {len(bundle) / 1024:.0f} KB bundles logged per request")
+    print(f"{'mode':<10}{'median ms':>12}{'p95 ms':>12}{'log KB':>14}")
+    for mode in ('disabled', 'sync', 'async'):
+        result = run(mode, args.requests, bundle)
+        print(f"{mode:<10}{result['median']:>12.3f}{result['p95']:>12.3f}{result['log_kb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
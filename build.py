@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# Minifies and fingerprints the static assets and templates into MIN_DIR for PRODUCTION.
+
+if __name__ == "__main__":
+    import config
+    from utils.assets import build_assets
+    manifest = build_assets(config.APP_DIR + '/static', config.APP_DIR + '/static/templates', config.MIN_DIR,
+                            keep_generations=config.ASSET_GENERATIONS_KEPT)
+    for original, fingerprinted in sorted(manifest.items()):
+        print(f" * {original} -> {fingerprinted}")
@@ -12,6 +12,8 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 APP_DIR = BASE_DIR + '/app'
 VIEWS_DIR = APP_DIR + '/views'
 MIN_DIR = APP_DIR + '/build'
+# Builds whose fingerprinted assets build.py keeps in MIN_DIR, including the current one
+ASSET_GENERATIONS_KEPT = 3
 
 PORT = 1555
 
@@ -26,4 +28,59 @@ REDIRECT_URI_PROD = "https://cds.curnexa.org/callback"
 
 
 # Add the Epic FHIR API base URL
-EPIC_FHIR_BASE_URL = "https://fhir.epic.com/interconnect-fhir-oauth/api/FHIR/R4/"  # Replace with the actual base URL
\ No newline at end of file
+EPIC_FHIR_BASE_URL = "https://fhir.epic.com/interconnect-fhir-oauth/api/FHIR/R4/"  # Replace with the actual base URL
+
+# Local BM25 index over PubMed articles that have already been fetched
+PUBMED_INDEX_DIR = BASE_DIR + '/data/pubmed_index'
+# Minimum fraction of condition terms the index must know before it answers without NCBI
+PUBMED_INDEX_MIN_COVERAGE = 0.8
+# Minimum number of ranked hits the index must return before it answers without NCBI
+PUBMED_INDEX_MIN_HITS = 5
+# New articles are written to the index in the background once this many have accumulated
+PUBMED_INDEX_FLUSH_DOCS = 50
+# Or once the oldest unwritten article has waited this many seconds
+PUBMED_INDEX_FLUSH_INTERVAL = 30
+# Index segments are merged into one once there are more than this many
+PUBMED_INDEX_MAX_SEGMENTS = 8
+# Number of articles requested per efetch call when fetching from the NCBI history server
+PUBMED_EFETCH_BATCH_SIZE = 200
+# Maximum number of PMIDs uploaded in a single epost call
+PUBMED_EPOST_MAX_IDS = 5000
+
+# Warm the launch patient's FHIR data and PubMed articles in the background after login
+PREFETCH_ENABLED = True
+PREFETCH_MAX_WORKERS = 4
+# Seconds a warmed patient context stays usable
+PREFETCH_TTL = 600
+# Seconds /handle-fhir-id waits for a queued prefetch to start before fetching itself
+PREFETCH_WAIT_TIMEOUT = 30
+# Seconds in total /handle-fhir-id waits for a prefetch that is already running before failing
+PREFETCH_MAX_WAIT = 120
+
+# Number of patient contexts whose PubMed articles are kept in memory
+PUBMED_RESULT_CACHE_SIZE = 256
+
+# Only download FHIR resources changed since the last visit (_lastUpdated) for returning patients
+FHIR_INCREMENTAL_SYNC = True
+# Seconds between full downloads of a patient's resources, as a safety net for missed deltas
+FHIR_FULL_RESYNC_INTERVAL = 24 * 60 * 60
+# Number of (patient, resource type) snapshots kept in memory
+FHIR_SYNC_MAX_ENTRIES = 2000
+
+# Logging: records are queued and written by a background thread, with tokens and PHI redacted
+LOG_JSON = True
+# Write logs to this file instead of stderr
+LOG_FILE = None
+# Records beyond this many pending ones are dropped rather than slowing requests down
+LOG_QUEUE_SIZE = 10000
+# Large payloads (FHIR bundles, API responses) are truncated to this many characters
+LOG_PAYLOAD_MAX_CHARS = 2000
+# Fraction of large payloads that are logged at all
+LOG_PAYLOAD_SAMPLE_RATE = 1.0
+
+# Response compression for clients that send Accept-Encoding: br or gzip
+COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript']
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
@@ -4,11 +4,23 @@ import xml.etree.ElementTree as ET
 from flask import current_app
 import datetime  # Import the datetime module
 import json
+import logging
+import time
+from urllib.parse import urlencode
+from fhir.patient_context import PatientContext
+from fhir.sync_store import ResourceSnapshot, get_sync_store
+from utils.logging_setup import log_payload
+
+FHIR_NS = {'fhir': 'http://hl7.org/fhir'}
+# Condition clinical statuses in the R4 'active' family, plus a missing status
+CURRENT_CONDITION_STATUSES = (None, 'active', 'recurrence', 'relapse')
 
 class FhirClient:
     def __init__(self):
         self.base_url = current_app.config['EPIC_FHIR_BASE_URL']
         self.token = None
+        # Snapshots for incremental _lastUpdated sync of returning patients
+        self.sync_store = get_sync_store(current_app.config['FHIR_SYNC_MAX_ENTRIES']) if current_app.config['FHIR_INCREMENTAL_SYNC'] else None
 
     def get_patient_data_by_fhir_id(self, fhir_id):
         try:
@@ -22,7 +34,7 @@ class FhirClient:
             patient_data['social_history'] = self.get_social_history_data(fhir_id)
             #patient_data['appointments'] = self.get_appointment_data(fhir_id)
 
-            return patient_data
+            return PatientContext.from_dict(patient_data)
         except Exception as e:
             current_app.logger.error(f"Error in get_patient_data_by_fhir_id: {e}")
             raise
@@ -41,9 +53,10 @@ class FhirClient:
                     current_app.logger.error(error_message)                
                     raise Exception("Unsupported response format")
             else:
-                error_message = f"Failed to retrieve patient data: {response.text}, Status Code: {response.status_code}"
-                current_app.logger.error(error_message)
-                raise Exception(f"Failed to retrieve patient data: {response.text}")
+                log_payload(current_app.logger, f"Failed to retrieve patient data, Status Code: {response.status_code}",
+                            response.text, level=logging.ERROR, resource_type='Patient', status_code=response.status_code)
+                # The body was logged above, capped and redacted; keep it out of the exception
+                raise Exception(f"Failed to retrieve patient data, Status Code: {response.status_code}")
         except requests.exceptions.RequestException as e:
             current_app.logger.error(f"Request error in get_basic_patient_data: {e}")
             raise
@@ -80,116 +93,141 @@ class FhirClient:
         return age
 
     def get_medication_data(self, fhir_id):
-        headers = {'Authorization': f'Bearer {self.token}'}
-        medication_url = f"{self.base_url}/MedicationRequest?patient={fhir_id}"
-        try:
-            response = requests.get(medication_url, headers=headers)
-            current_app.logger.debug(f"Medication API Response: {response.text}")
-
-            if response.status_code != 200:
-                error_message = f"Failed to retrieve medication data: {response.text}, Status Code: {response.status_code}"
-                current_app.logger.error(error_message)
-                raise Exception(error_message)
-
-            if not response.text:
-                error_message = "Empty response received from medication data API"
-                current_app.logger.error(error_message)
-                raise Exception(error_message)
-
-            root = ET.fromstring(response.text)
-            ns = {'fhir': 'http://hl7.org/fhir'}
-            medications = []
-            for entry in root.findall('.//fhir:entry', ns):
-                medication_display = entry.find('.//fhir:medicationReference/fhir:display', ns)
-                if medication_display is not None:
-                    medications.append(medication_display.attrib.get('value', 'Unknown medication'))
-            return ', '.join(medications) if medications else ['Unknown medication']
-
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Request error in get_medication_data: {e}")
-            raise
-    
+        return self.get_resource_values(
+            fhir_id, 'MedicationRequest', {'patient': fhir_id}, 'medication data', self.parse_medication)
 
     def get_allergy_data(self, fhir_id):
-        headers = {'Authorization': f'Bearer {self.token}'}
-        allergy_url = f"{self.base_url}AllergyIntolerance?patient={fhir_id}"
-        try:
-            response = requests.get(allergy_url, headers=headers)
+        return self.get_resource_values(
+            fhir_id, 'AllergyIntolerance', {'patient': fhir_id}, 'allergy data', self.parse_allergy)
 
-            if response.status_code != 200:
-                error_message = f"Failed to retrieve allergy data: {response.text}, Status Code: {response.status_code}"
-                current_app.logger.error(error_message)
-                raise Exception(error_message)
-
-            current_app.logger.debug(f"Allergy API Response: {response.text}")
-
-            root = ET.fromstring(response.text)
-            ns = {'fhir': 'http://hl7.org/fhir'}
-            allergies = []
-            for entry in root.findall('.//fhir:entry', ns):
-                allergy_display = entry.find('.//fhir:AllergyIntolerance/fhir:code/fhir:coding/fhir:display', ns)
-                if allergy_display is not None:
-                    allergies.append(allergy_display.attrib.get('value', 'No known allergies'))
-            return ', '.join(allergies) if allergies else ['No known allergies']
-
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Request error in get_allergy_data: {e}")
-            raise
-
-        
     def get_condition_data(self, fhir_id):
+        # Only current problems are downloaded on a full sync; deltas also need the
+        # resources that became inactive so they can be dropped from the snapshot.
+        # Token search matches codes exactly, so recurrence and relapse are listed too.
+        current_statuses = ','.join(status for status in CURRENT_CONDITION_STATUSES if status)
+        return self.get_resource_values(
+            fhir_id, 'Condition', {'category': 'problem-list-item', 'patient': fhir_id}, 'condition data',
+            self.parse_condition, full_sync_params={'clinical-status': current_statuses})
+
+    def get_social_history_data(self, fhir_id):
+        try:
+            return self.get_resource_values(
+                fhir_id, 'Observation', {'patient': fhir_id, 'category': 'social-history'}, 'social history data',
+                self.parse_social_history)
+        except Exception as e:
+            current_app.logger.error(f"Error in get_social_history_data: {e}")
+            return []
+
+    def get_resource_values(self, fhir_id, resource_type, params, label, parse_resource, full_sync_params=None):
+        """
+        Searches resource_type for a patient and returns the display values of its current resources.
+
+        With incremental sync enabled, a returning patient only downloads resources changed since
+        the stored watermark (_lastUpdated=gt), which are merged into the stored snapshot. A full
+        download happens on the first visit, every FHIR_FULL_RESYNC_INTERVAL seconds, and whenever
+        the delta query fails.
+        """
+        snapshot = self.sync_store.get(fhir_id, resource_type) if self.sync_store is not None else None
+        full_sync = snapshot is None or snapshot.needs_full_resync(current_app.config['FHIR_FULL_RESYNC_INTERVAL'])
+
+        if not full_sync:
+            try:
+                delta_params = dict(params, _lastUpdated=f"gt{snapshot.watermark}")
+                root = self.search(resource_type, delta_params, label)
+                resources, watermark = self.parse_bundle(root, resource_type, parse_resource)
+                entries = dict(snapshot.entries)
+                for resource_id, (value, current) in resources.items():
+                    if current and value:
+                        entries[resource_id] = value
+                    else:
+                        entries.pop(resource_id, None)
+                self.sync_store.put(fhir_id, resource_type, ResourceSnapshot(
+                    entries, watermark or snapshot.watermark, snapshot.full_synced_at))
+                return list(entries.values())
+            except Exception as e:
+                current_app.logger.error(f"Incremental sync of {label} failed, running a full sync: {e}")
+
+        root = self.search(resource_type, dict(params, **(full_sync_params or {})), label)
+        resources, watermark = self.parse_bundle(root, resource_type, parse_resource)
+        entries = {resource_id: value for resource_id, (value, current) in resources.items() if current and value}
+        if self.sync_store is not None:
+            self.sync_store.put(fhir_id, resource_type, ResourceSnapshot(entries, watermark, time.time()))
+        return list(entries.values())
+
+    def search(self, resource_type, params, label):
         headers = {'Authorization': f'Bearer {self.token}'}
-        condition_url = f"{self.base_url}Condition?category=problem-list-item&clinical-status=active&patient={fhir_id}"
+        url = f"{self.base_url}{resource_type}?{urlencode(params)}"
         try:
-            response = requests.get(condition_url, headers=headers)
+            response = requests.get(url, headers=headers)
+            log_payload(current_app.logger, f"{resource_type} API Response", response.text,
+                        resource_type=resource_type, status_code=response.status_code)
 
             if response.status_code != 200:
-                error_message = f"Failed to retrieve condition data: {response.text}, Status Code: {response.status_code}"
+                log_payload(current_app.logger, f"Failed to retrieve {label}, Status Code: {response.status_code}",
+                            response.text, level=logging.ERROR, resource_type=resource_type, status_code=response.status_code)
+                raise Exception(f"Failed to retrieve {label}, Status Code: {response.status_code}")
+
+            if not response.text:
+                error_message = f"Empty response received from {label} API"
                 current_app.logger.error(error_message)
                 raise Exception(error_message)
 
-            current_app.logger.debug(f"Condition API Response: {response.text}")
-
-            root = ET.fromstring(response.text)
-            ns = {'fhir': 'http://hl7.org/fhir'}
-            conditions = []
-            for entry in root.findall('.//fhir:entry', ns):
-                condition_text = entry.find('.//fhir:Condition/fhir:code/fhir:text', ns)
-                if condition_text is not None:
-                    conditions.append(condition_text.attrib.get('value', 'No known conditions'))
-            return ', '.join(conditions) if conditions else ['No known conditions']
+            return ET.fromstring(response.text)
 
         except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Request error in get_condition_data: {e}")
+            current_app.logger.error(f"Request error retrieving {label}: {e}")
             raise
 
-
-    def get_social_history_data(self, fhir_id):
-        headers = {'Authorization': f'Bearer {self.token}'}
-        social_history_url = f"{self.base_url}Observation?patient={fhir_id}&category=social-history"
+    def parse_bundle(self, root, resource_type, parse_resource):
+        """
+        Returns ({resource id: (display value, is current)}, watermark) for a search Bundle.
+        The watermark is the Bundle's lastUpdated, or else the newest resource's lastUpdated.
+        """
+        resources = {}
+        newest = None
+        for position, resource in enumerate(root.findall(f'fhir:entry/fhir:resource/fhir:{resource_type}', FHIR_NS)):
+            resource_id = self.find_value(resource, 'fhir:id') or f"#{position}"
+            last_updated = self.find_value(resource, 'fhir:meta/fhir:lastUpdated')
+            if last_updated and (newest is None or self.parse_instant(last_updated) > self.parse_instant(newest)):
+                newest = last_updated
+            resources[resource_id] = parse_resource(resource)
+        return resources, self.find_value(root, 'fhir:meta/fhir:lastUpdated') or newest
+
+    def parse_instant(self, value):
+        """Parses a FHIR instant so watermarks with different UTC offsets compare correctly."""
         try:
-            response = requests.get(social_history_url, headers=headers)
-
-            if response.status_code != 200:
-                current_app.logger.error(f"Failed to retrieve social history data: {response.text}, Status Code: {response.status_code}")
-                return "None"
-
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+    def find_value(self, element, path):
+        found = element.find(path, FHIR_NS)
+        return found.attrib.get('value') if found is not None else None
+
+    def parse_medication(self, resource):
+        status = self.find_value(resource, 'fhir:status')
+        value = self.find_value(resource, './/fhir:medicationReference/fhir:display')
+        return value, status not in ('entered-in-error', 'cancelled')
+
+    def parse_allergy(self, resource):
+        clinical_status = self.find_value(resource, 'fhir:clinicalStatus/fhir:coding/fhir:code')
+        verification_status = self.find_value(resource, 'fhir:verificationStatus/fhir:coding/fhir:code')
+        value = self.find_value(resource, 'fhir:code/fhir:coding/fhir:display')
+        current = clinical_status not in ('inactive', 'resolved') and verification_status not in ('entered-in-error', 'refuted')
+        return value, current
+
+    def parse_condition(self, resource):
+        clinical_status = self.find_value(resource, 'fhir:clinicalStatus/fhir:coding/fhir:code')
+        verification_status = self.find_value(resource, 'fhir:verificationStatus/fhir:coding/fhir:code')
+        value = self.find_value(resource, 'fhir:code/fhir:text')
+        current = clinical_status in CURRENT_CONDITION_STATUSES and verification_status != 'entered-in-error'
+        return value, current
+
+    def parse_social_history(self, resource):
+        status = self.find_value(resource, 'fhir:status')
+        value = self.find_value(resource, 'fhir:valueCodeableConcept/fhir:coding/fhir:display')
+        return value, status not in ('entered-in-error', 'cancelled')
 
-            current_app.logger.debug(f"Social History API Response: {response.text}")
-
-            root = ET.fromstring(response.text)
-            ns = {'fhir': 'http://hl7.org/fhir'}
-            social_histories = []
-            for entry in root.findall('.//fhir:entry', ns):
-                social_history_display = entry.find('.//fhir:Observation/fhir:valueCodeableConcept/fhir:coding/fhir:display', ns)
-                if social_history_display is not None:
-                    social_histories.append(social_history_display.attrib.get('value', 'No social history assessed'))
-            return ', '.join(social_histories) if social_histories else ['No social history assessed']
-
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Request error in get_social_history_data: {e}")
-            return "None"
-        
     '''def get_appointment_data(self, fhir_id):
         headers = {'Authorization': f'Bearer {self.token}'}
         appointment_url = f"{self.base_url}/Appointment?patient={fhir_id}&service-category=appointment"
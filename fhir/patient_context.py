@@ -0,0 +1,119 @@
+# fhir/patient_context.py
+import hashlib
+import json
+
+# Placeholder values the FHIR parsers and older records use for "nothing recorded"
+EMPTY_VALUES = frozenset([
+    '', 'none', 'unknown', 'n/a',
+    'unknown medication', 'no known allergies', 'no known conditions', 'no social history assessed',
+])
+
+CODED_FIELDS = ('medications', 'allergies', 'conditions', 'social_history')
+
+
+def normalize_coded_list(values):
+    """
+    Turns a comma-joined string, list or None into a sorted tuple of unique entries,
+    dropping placeholders. Entries are compared case-insensitively.
+    """
+    if values is None:
+        return ()
+    if isinstance(values, str):
+        values = values.split(',')
+    seen = {}
+    for value in values:
+        if value is None:
+            continue
+        value = ' '.join(str(value).split())
+        key = value.lower()
+        if key in EMPTY_VALUES:
+            continue
+        # Pick the same spelling among case variants whatever order they arrive in
+        seen[key] = min(seen[key], value) if key in seen else value
+    return tuple(seen[key] for key in sorted(seen))
+
+
+def normalize_age(age):
+    try:
+        return int(age)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_gender(gender):
+    if gender is None:
+        return None
+    gender = str(gender).strip().lower()
+    return None if gender in EMPTY_VALUES else gender
+
+
+class PatientContext:
+    """
+    Normalized patient context used for PubMed queries, prompts and result storage.
+
+    Coded lists are sorted tuples without placeholders, so equivalent FHIR records produce
+    the same fingerprint regardless of entry order, letter case or which placeholder a
+    parser used. Instances are read-only, since the fingerprint keys cached results.
+    """
+
+    __slots__ = ('age', 'gender', 'medications', 'allergies', 'conditions', 'social_history', '_fingerprint')
+
+    def __init__(self, age=None, gender=None, medications=None, allergies=None, conditions=None, social_history=None):
+        object.__setattr__(self, 'age', normalize_age(age))
+        object.__setattr__(self, 'gender', normalize_gender(gender))
+        object.__setattr__(self, 'medications', normalize_coded_list(medications))
+        object.__setattr__(self, 'allergies', normalize_coded_list(allergies))
+        object.__setattr__(self, 'conditions', normalize_coded_list(conditions))
+        object.__setattr__(self, 'social_history', normalize_coded_list(social_history))
+        object.__setattr__(self, '_fingerprint', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"PatientContext is read-only; build a new one instead of setting {name!r}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"PatientContext is read-only; cannot delete {name!r}")
+
+    def __reduce__(self):
+        return PatientContext.from_dict, (self.to_dict(),)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data.get(field) for field in ('age', 'gender') + CODED_FIELDS})
+
+    def to_dict(self):
+        return {
+            'age': self.age,
+            'gender': self.gender,
+            'medications': list(self.medications),
+            'allergies': list(self.allergies),
+            'conditions': list(self.conditions),
+            'social_history': list(self.social_history),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':'))
+
+    @property
+    def fingerprint(self):
+        """Stable content hash of the normalized context."""
+        if self._fingerprint is None:
+            # Coded entries are compared case-insensitively, so hash them that way too
+            canonical = [self.age, self.gender] + ['\x1f'.join(getattr(self, field)).lower() for field in CODED_FIELDS]
+            data = json.dumps(canonical, separators=(',', ':')).encode('utf-8')
+            object.__setattr__(self, '_fingerprint', hashlib.blake2b(data, digest_size=16).hexdigest())
+        return self._fingerprint
+
+    def display(self, field, empty='None recorded'):
+        """Comma-joined value of a coded list for prompts and reports."""
+        return ', '.join(getattr(self, field)) or empty
+
+    def __eq__(self, other):
+        if not isinstance(other, PatientContext):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def __repr__(self):
+        return f"PatientContext(age={self.age!r}, gender={self.gender!r}, fingerprint={self.fingerprint!r})"
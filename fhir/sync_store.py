@@ -0,0 +1,65 @@
+# fhir/sync_store.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResourceSnapshot:
+    """Last synced state of one resource type for one patient."""
+
+    __slots__ = ('entries', 'watermark', 'full_synced_at')
+
+    def __init__(self, entries, watermark, full_synced_at):
+        self.entries = entries  # resource id -> display value
+        self.watermark = watermark  # FHIR instant of the last sync, used for _lastUpdated=gt
+        self.full_synced_at = full_synced_at  # time.time() of the last full download
+
+    def needs_full_resync(self, interval):
+        return self.watermark is None or time.time() - self.full_synced_at > interval
+
+
+class FhirSyncStore:
+    """
+    In-memory snapshots of patients' FHIR resources, keyed by (fhir_id, resource_type).
+    Least recently used snapshots are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fhir_id, resource_type):
+        with self._lock:
+            snapshot = self.snapshots.get((fhir_id, resource_type))
+            if snapshot is not None:
+                self.snapshots.move_to_end((fhir_id, resource_type))
+            return snapshot
+
+    def put(self, fhir_id, resource_type, snapshot):
+        with self._lock:
+            self.snapshots[(fhir_id, resource_type)] = snapshot
+            self.snapshots.move_to_end((fhir_id, resource_type))
+            while len(self.snapshots) > self.max_entries:
+                self.snapshots.popitem(last=False)
+
+    def clear(self, fhir_id=None):
+        with self._lock:
+            if fhir_id is None:
+                self.snapshots.clear()
+                return
+            for key in [key for key in self.snapshots if key[0] == fhir_id]:
+                del self.snapshots[key]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sync_store(max_entries=2000):
+    """Return the process-wide sync store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FhirSyncStore(max_entries)
+        return _store
@@ -3,13 +3,16 @@ import uuid
 import os
 from flask import Flask, request, redirect, render_template, jsonify, url_for, session
 from models.llama_chat import query_llama_with_retry
-from utils.pubmed_fetch import fetch_pubmed_data, fetch_article_details
+from utils.pubmed_fetch import fetch_articles_for_patient
+from utils.prefetch import PatientPrefetcher
 from auth.oauth_handler import get_auth_url, exchange_code_for_token, generate_code_verifier, generate_code_challenge
 from fhir.fhir_client import FhirClient
 import config
 from dotenv import load_dotenv
 from flask import current_app
 from models.openai_chat import query_openai
+from utils.logging_setup import configure_logging, log_payload
+from utils.http_caching import init_http_caching
 
 load_dotenv()
 
@@ -24,38 +27,42 @@ app = Flask(__name__,
 # Load configuration from config.py
 app.config.from_object('config')
 
+# Write logs from a background thread, with tokens and PHI redacted
+configure_logging(app)
+
+# Fingerprinted assets in PRODUCTION, gzip/brotli for JSON and HTML
+init_http_caching(app)
+
 # Set secret key for session
 app.secret_key = os.environ.get('FLASK_SECRET_KEY')
 
+# Background warm-up of patient data started from the OAuth callback
+prefetcher = PatientPrefetcher(max_workers=app.config['PREFETCH_MAX_WORKERS'], ttl=app.config['PREFETCH_TTL'])
+
 def is_authenticated():
     """Check if the user is authenticated."""
     return 'access_token' in session and session['access_token'] is not None
 
 
-def process_patient_record(patient_data):
-    # Fetch articles from PubMed
-    article_ids = fetch_pubmed_data(
-        age=patient_data.get('age', ''),
-        gender=patient_data.get('gender', ''),
-        medications=patient_data.get('medications', ''),
-        allergies=patient_data.get('allergies', ''),
-        conditions=patient_data.get('conditions', ''),
-        social_history=patient_data.get('social_history', '')
-    )
-    articles = fetch_article_details(article_ids) if article_ids else []
+def process_patient_record(patient_context, articles=None):
+    # Fetch articles from PubMed unless they were already prefetched
+    if articles is None:
+        articles = fetch_articles_for_patient(patient_context)
 
     # Create prompt for OpenAI
-    prompt = create_openai_prompt(patient_data, articles)
+    prompt = create_openai_prompt(patient_context, articles)
     openai_response = query_openai(prompt)
     generated_text = openai_response.get('choices', [{}])[0].get('message', {}).get('content', '')
-    current_app.logger.debug(f"OpenAI Response: {openai_response}")
+    log_payload(current_app.logger, "OpenAI Response", openai_response,
+                model=openai_response.get('model'), usage=openai_response.get('usage'))
 
-    return {'patient_data': patient_data, 'prompt': prompt, 'articles': articles, 'openai_response': generated_text}
+    return {'patient_data': patient_context.to_dict(), 'patient_fingerprint': patient_context.fingerprint,
+            'prompt': prompt, 'articles': articles, 'openai_response': generated_text}
 
-def create_openai_prompt(patient_data, articles):
-    medical_info = f"Patient Information: Age {patient_data['age']}, Gender {patient_data['gender']}, " \
-                   f"Medications: {patient_data['medications']}, Allergies: {patient_data['allergies']}, " \
-                   f"Conditions: {patient_data['conditions']}, Social History: {patient_data['social_history']}.\n\n"
+def create_openai_prompt(patient_context, articles):
+    medical_info = f"Patient Information: Age {patient_context.age or 'Unknown'}, Gender {patient_context.gender or 'Unknown'}, " \
+                   f"Medications: {patient_context.display('medications')}, Allergies: {patient_context.display('allergies')}, " \
+                   f"Conditions: {patient_context.display('conditions')}, Social History: {patient_context.display('social_history')}.\n\n"
 
     article_context = "Here are some relevant PubMed articles for context:\n"
     for article in articles:
@@ -70,11 +77,17 @@ def create_openai_prompt(patient_data, articles):
 def generate_unique_state():
     return str(uuid.uuid4())
 
+def get_prefetch_key():
+    """Identifies this browser session's prefetch job."""
+    if 'prefetch_key' not in session:
+        session['prefetch_key'] = str(uuid.uuid4())
+    return session['prefetch_key']
+
 @app.route('/')
 def index():
     if not is_authenticated():
         return redirect(url_for('start_auth'))
-    return render_template('index.html')
+    return render_template('index.html', launch_patient=session.get('launch_patient'))
 
 @app.route('/start_auth')
 def start_auth():
@@ -95,6 +108,12 @@ def callback():
     code_verifier = session.get('code_verifier')  # Retrieve code_verifier from session
     token_info = exchange_code_for_token(code, code_verifier)
     session['access_token'] = token_info['access_token']  # Store access token in session
+
+    # SMART launches include the patient in context; start loading their chart right away
+    launch_patient = token_info.get('patient')
+    session['launch_patient'] = launch_patient
+    if launch_patient and app.config['PREFETCH_ENABLED']:
+        prefetcher.start(app, get_prefetch_key(), token_info['access_token'], launch_patient)
     return redirect(url_for('index'))
 
 @app.route('/handle-fhir-id', methods=['POST'])
@@ -112,24 +131,25 @@ def handle_fhir_id():
     if not access_token:
         return jsonify({'error': 'Access token is missing'}), 401
 
-    fhir_client = FhirClient()
-    fhir_client.token = access_token
-
     try:
-        patient_data = fhir_client.get_patient_data_by_fhir_id(fhir_id)
-
-        # Retrieve additional information
-        patient_data['medications'] = fhir_client.get_medication_data(fhir_id)
-        patient_data['allergies'] = fhir_client.get_allergy_data(fhir_id)
-        patient_data['conditions'] = fhir_client.get_condition_data(fhir_id)
-        patient_data['social_history'] = fhir_client.get_social_history_data(fhir_id)
-
-        result = process_patient_record(patient_data)
+        # Reuse the chart warmed after login; a different patient cancels that prefetch
+        prefetched = prefetcher.take(get_prefetch_key(), fhir_id, timeout=app.config['PREFETCH_WAIT_TIMEOUT'],
+                                     max_wait=app.config['PREFETCH_MAX_WAIT'])
+        if prefetched is not None:
+            patient_context, articles = prefetched
+        else:
+            fhir_client = FhirClient()
+            fhir_client.token = access_token
+            # Includes medications, allergies, conditions and social history
+            patient_context = fhir_client.get_patient_data_by_fhir_id(fhir_id)
+            articles = None
+
+        result = process_patient_record(patient_context, articles)
         # Save or handle the result as needed
         with open('data/llama_responses.csv', 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=['patient_data', 'prompt', 'openai_response', 'articles'])
+            writer = csv.DictWriter(file, fieldnames=['patient_fingerprint', 'patient_data', 'prompt', 'openai_response', 'articles'])
             writer.writeheader()
-            writer.writerow(result)
+            writer.writerow(dict(result, patient_data=patient_context.to_json()))
 
         return jsonify(result)  # Return the result as JSON
     except Exception as e:
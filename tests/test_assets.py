@@ -0,0 +1,38 @@
+import os
+
+from utils.assets import build_assets, minify_css, minify_html, minify_js
+
+
+def test_js_keeps_regex_literals_after_keywords():
+    assert minify_js('function f(x) {\n  return /a  b/.test(x);\n}') == 'function f(x){\nreturn/a  b/.test(x);\n}\n'
+    assert minify_js('if (typeof /a  b/ === "object") {}') == 'if(typeof/a  b/==="object"){}\n'
+
+
+def test_js_keeps_division_strings_and_template_literals():
+    source = 'var a = b / c / d; // comment\nvar s = "x  //  y" + `  ${a}  `;'
+    assert minify_js(source) == 'var a=b/c/d;\nvar s="x  //  y"+`  ${a}  `;\n'
+
+
+def test_css_keeps_quoted_strings():
+    source = '.a::after {\n  content: "a ; b  /* c */";\n  /* comment */\n  color: red;\n}'
+    assert minify_css(source) == '.a::after{content:"a ; b  /* c */";color:red}\n'
+
+
+def test_html_keeps_script_bodies():
+    source = '<div>\n  <p>a</p>\n</div>\n<script>\n  var a = 1;\n</script>'
+    assert minify_html(source) == '<div><p>a</p></div> <script>\n  var a = 1;\n</script>\n'
+
+
+def test_build_keeps_recent_generations_of_fingerprinted_files(tmp_path):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'templates').mkdir(parents=True)
+    build_dir = str(tmp_path / 'build')
+
+    built = []
+    for color in ('red', 'green', 'blue', 'black'):
+        (static_dir / 'site.css').write_text(f'body {{ color: {color}; }}')
+        built.append(build_assets(str(static_dir), str(static_dir / 'templates'), build_dir, keep_generations=3)['site.css'])
+
+    static_files = set(os.listdir(os.path.join(build_dir, 'static')))
+    assert built[0] not in static_files and built[0] + '.gz' not in static_files
+    assert {built[1], built[1] + '.gz', built[2], built[3]} <= static_files
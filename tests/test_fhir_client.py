@@ -0,0 +1,79 @@
+from urllib.parse import parse_qs, urlparse
+
+import flask
+import pytest
+import requests
+
+from fhir import fhir_client
+from fhir.sync_store import FhirSyncStore
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.status_code = 200
+        self.headers = {}
+
+
+def condition_bundle(*conditions):
+    entries = ''.join(
+        f'<entry><resource><Condition><id value="{resource_id}"/>'
+        f'<meta><lastUpdated value="{last_updated}"/></meta>'
+        f'<clinicalStatus><coding><code value="{status}"/></coding></clinicalStatus>'
+        f'<code><text value="{text}"/></code></Condition></resource></entry>'
+        for resource_id, last_updated, status, text in conditions
+    )
+    return f'<Bundle xmlns="http://hl7.org/fhir">{entries}</Bundle>'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = flask.Flask(__name__)
+    app.config.from_object('config')
+    monkeypatch.setattr(fhir_client, 'get_sync_store', lambda max_entries: FhirSyncStore(max_entries))
+    with app.app_context():
+        client = fhir_client.FhirClient()
+        client.token = 'token'
+        yield client
+
+
+def test_delta_keeps_recurring_and_drops_resolved_conditions(client, monkeypatch):
+    responses = [
+        condition_bundle(('1', '2024-01-01T00:00:00Z', 'active', 'CKD'),
+                         ('2', '2024-01-01T00:00:00Z', 'active', 'Gout')),
+        condition_bundle(('1', '2024-02-01T00:00:00Z', 'recurrence', 'CKD'),
+                         ('2', '2024-02-01T00:00:00Z', 'resolved', 'Gout')),
+    ]
+    urls = []
+
+    def fake_get(url, headers=None):
+        urls.append(url)
+        return FakeResponse(responses.pop(0))
+
+    monkeypatch.setattr(requests, 'get', fake_get)
+
+    assert sorted(client.get_condition_data('patient')) == ['CKD', 'Gout']
+    assert client.get_condition_data('patient') == ['CKD']
+    assert '_lastUpdated=gt2024-01-01T00%3A00%3A00Z' in urls[1]
+
+
+def test_full_resync_keeps_recurring_conditions(client, monkeypatch):
+    # The server's conditions; clinical-status search matches codes exactly, like a real FHIR server
+    conditions = {'1': ('2024-01-01T00:00:00Z', 'active', 'CKD'), '2': ('2024-01-01T00:00:00Z', 'active', 'Gout')}
+
+    def fake_get(url, headers=None):
+        query = parse_qs(urlparse(url).query)
+        statuses = query['clinical-status'][0].split(',') if 'clinical-status' in query else None
+        return FakeResponse(condition_bundle(*(
+            (resource_id,) + condition for resource_id, condition in sorted(conditions.items())
+            if statuses is None or condition[1] in statuses
+        )))
+
+    monkeypatch.setattr(requests, 'get', fake_get)
+
+    assert sorted(client.get_condition_data('patient')) == ['CKD', 'Gout']
+    conditions['1'] = ('2024-02-01T00:00:00Z', 'recurrence', 'CKD')
+    assert sorted(client.get_condition_data('patient')) == ['CKD', 'Gout']
+
+    flask.current_app.config['FHIR_FULL_RESYNC_INTERVAL'] = -1
+    assert sorted(client.get_condition_data('patient')) == ['CKD', 'Gout']
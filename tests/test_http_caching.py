@@ -0,0 +1,70 @@
+import gzip
+
+import flask
+import pytest
+
+from utils.assets import build_assets
+from utils.http_caching import init_http_caching
+
+
+@pytest.fixture
+def app(tmp_path):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'templates').mkdir(parents=True)
+    (static_dir / 'site.css').write_text('body {\n  color: red;\n}\n' * 100)
+    (static_dir / 'robots.txt').write_text('User-agent: *\n')
+    build_dir = tmp_path / 'build'
+    manifest = build_assets(str(static_dir), str(static_dir / 'templates'), str(build_dir))
+
+    app = flask.Flask(__name__, static_folder=str(static_dir), template_folder=str(static_dir / 'templates'))
+    app.config.from_object('config')
+    app.config.update(PRODUCTION=True, MIN_DIR=str(build_dir))
+    init_http_caching(app)
+
+    @app.route('/css-url')
+    def css_url():
+        return flask.url_for('static', filename='site.css')
+
+    @app.route('/data/<int:size>')
+    def data(size):
+        return flask.jsonify({'text': 'x' * size})
+
+    app.manifest = manifest
+    return app
+
+
+def test_static_urls_point_at_fingerprinted_files(app):
+    assert app.test_client().get('/css-url').text == f"/static/{app.manifest['site.css']}"
+
+
+def test_fingerprinted_files_are_precompressed_and_immutable(app):
+    client = app.test_client()
+    response = client.get(f"/static/{app.manifest['site.css']}", headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data).startswith(b'body{color:red}')
+
+    plain = client.get(f"/static/{app.manifest['site.css']}")
+    assert 'Content-Encoding' not in plain.headers
+    plain.close()
+
+    unversioned = client.get('/static/robots.txt')
+    assert 'immutable' not in unversioned.headers.get('Cache-Control', '')
+    unversioned.close()
+    response.close()
+
+
+def test_responses_are_compressed_above_the_minimum_size(app):
+    client = app.test_client()
+    min_size = app.config['COMPRESS_MIN_SIZE']
+
+    small = client.get('/data/10', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert 'Accept-Encoding' in small.headers['Vary']
+
+    large = client.get(f'/data/{min_size}', headers={'Accept-Encoding': 'gzip'})
+    assert large.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(large.data) == client.get(f'/data/{min_size}').data
@@ -0,0 +1,74 @@
+import utils.pubmed_fetch as pubmed_fetch
+from utils.literature_index import LiteratureIndex
+
+
+def make_index(tmp_path, titles):
+    index = LiteratureIndex(str(tmp_path)).load()
+    index.add_articles({'pmid': str(num), 'title': title, 'abstract': ''} for num, title in enumerate(titles))
+    index.save()
+    return index
+
+
+def test_partial_term_matches_fall_back_to_ncbi(tmp_path, monkeypatch):
+    index = make_index(tmp_path, ["Lung cancer screening"] * 5 + ["Breast milk composition"] * 5)
+    monkeypatch.setattr(pubmed_fetch, 'get_literature_index', lambda: index)
+
+    assert pubmed_fetch.search_literature_index('Breast cancer') is None
+
+
+def test_articles_covering_the_conditions_are_served_locally(tmp_path, monkeypatch):
+    index = make_index(tmp_path, ["Lung cancer screening"] * 5 + ["Breast cancer outcomes"] * 5)
+    monkeypatch.setattr(pubmed_fetch, 'get_literature_index', lambda: index)
+
+    assert sorted(pubmed_fetch.search_literature_index('Breast cancer')) == ['5', '6', '7', '8', '9']
+
+
+def test_search_only_ranks_articles_covering_the_required_terms(tmp_path):
+    index = make_index(tmp_path, ["Breast cancer and tamoxifen"] * 2 + ["Tamoxifen tamoxifen tamoxifen"] * 3)
+    index.add_article('5', 'Breast cancer outcomes', '')
+
+    results = index.search('breast cancer tamoxifen', max_results=3, required='breast cancer')
+    assert [pmid for pmid, _ in results] == ['0', '1', '5']
+    assert index.search('breast cancer tamoxifen', max_results=3, required='breast cancer lymphoma',
+                        min_coverage=0.6) == results
+    assert index.search('breast cancer tamoxifen', required='breast cancer lymphoma') == []
+
+def test_workers_sharing_an_index_keep_each_others_articles(tmp_path):
+    first = LiteratureIndex(str(tmp_path)).load()
+    second = LiteratureIndex(str(tmp_path)).load()
+    first.add_article('1', 'Gout flares', '')
+    second.add_article('2', 'Gout diet', '')
+    second.add_article('1', 'Gout flares', '')
+    first.save()
+    second.save()
+
+    reloaded = LiteratureIndex(str(tmp_path)).load()
+    assert len(reloaded) == 2
+    assert sorted(pmid for pmid, _ in reloaded.search('gout')) == ['1', '2']
+
+
+def test_segments_are_merged_past_max_segments(tmp_path):
+    index = LiteratureIndex(str(tmp_path), max_segments=2).load()
+    for pmid in range(4):
+        index.add_article(str(pmid), f'Asthma trial {pmid}', '')
+        index.save()
+
+    assert len(index.segments) <= 2
+    assert len(LiteratureIndex(str(tmp_path)).load().search('asthma')) == 4
+
+
+def test_article_text_is_read_back_from_disk(tmp_path):
+    index = LiteratureIndex(str(tmp_path)).load()
+    index.add_article('1', 'Sjögren syndrome', 'No abstract available')
+    index.add_article('2', 'No title available', 'Xerostomia in "dry mouth" patients')
+    index.save()
+    index.add_article('3', 'Unsaved article', '')
+
+    assert index.get_article('3')['title'] == 'Unsaved article'
+    reloaded = LiteratureIndex(str(tmp_path)).load()
+    assert reloaded.get_article('1') == {'pmid': '1', 'title': 'Sjögren syndrome', 'abstract': 'No abstract available'}
+    assert reloaded.get_article('2')['abstract'] == 'Xerostomia in "dry mouth" patients'
+    assert reloaded.get_article('3') is None
+    # The placeholders for missing fields are stored but not indexed
+    assert reloaded.search('no title available') == []
+    assert reloaded.search('abstract') == []
@@ -0,0 +1,101 @@
+from utils.logging_setup import redact, truncate_payload
+
+
+def test_truncated_payload_is_still_redacted():
+    bundle = '<Patient><name><family value="Smithson"/><given value="Alexandra"/></name></Patient>'
+    for max_chars in range(1, len(bundle)):
+        truncated = redact(truncate_payload(bundle, max_chars))
+        assert 'Smi' not in truncated
+        assert 'Alex' not in truncated
+
+
+def test_redacts_api_keys_in_query_strings():
+    assert 'SECRET' not in redact('esearch.fcgi?term=x&api_key=SECRET&retmax=10')
+
+
+def test_payload_records_point_at_the_caller_and_use_app_config(caplog):
+    import logging
+    import flask
+    from utils import logging_setup
+
+    app = flask.Flask(__name__)
+    app.config.update(LOG_PAYLOAD_MAX_CHARS=10, LOG_PAYLOAD_SAMPLE_RATE=1.0)
+    handler = logging.NullHandler()
+    try:
+        logging_setup.configure_logging(app, [handler])
+        logger = logging.getLogger('payload-test')
+        with caplog.at_level(logging.DEBUG, logger='payload-test'):
+            logging_setup.log_payload(logger, 'Bundle', 'aaaa bbbb cccc dddd')
+    finally:
+        logging_setup.stop_logging()
+        logging.getLogger().handlers = [h for h in logging.getLogger().handlers
+                                        if not isinstance(h, logging_setup.DroppingQueueHandler)]
+
+    record = caplog.records[-1]
+    assert record.funcName == 'test_payload_records_point_at_the_caller_and_use_app_config'
+    assert record.getMessage() == 'Bundle: aaaa bbbb... [truncated 10 chars]'
+
+
+PATIENT = '''<Patient xmlns="http://hl7.org/fhir">
+  <id value="eXbMln3hu0PfFrpv2HgVHyg3"/>
+  <identifier>
+    <use value="usual"/>
+    <system value="urn:oid:1.2.840.114350.1.13.0.1.7.5.737384.14"/>
+    <value value="MRN12345"/>
+  </identifier>
+  <active value="true"/>
+  <name>
+    <use value="official"/>
+    <text value="Jane Q Doe"/>
+    <family value="Doe"/>
+    <given value="Jane"/>
+  </name>
+  <telecom>
+    <system value="phone"/>
+    <value value="5551234567"/>
+  </telecom>
+  <telecom>
+    <system value="email"/>
+    <value value="jane.doe@example.com"/>
+  </telecom>
+  <gender value="female"/>
+  <birthDate value="1970-01-01"/>
+  <address>
+    <use value="home"/>
+    <line value="123 Main St"/>
+    <city value="Springfield"/>
+    <district value="Sangamon"/>
+    <state value="IL"/>
+    <postalCode value="62701"/>
+    <country value="USA"/>
+  </address>
+</Patient>'''
+
+
+def test_redacts_phi_in_a_fhir_patient():
+    redacted = redact(PATIENT)
+    for value in ('MRN12345', 'Jane', 'Doe', '5551234567', 'jane.doe', '1970-01-01',
+                  '123 Main St', 'Springfield', 'Sangamon', 'value="IL"', '62701'):
+        assert value not in redacted
+    # Codes that aren't identifying are left readable
+    for value in ('value="usual"', 'value="phone"', 'value="female"', 'value="USA"', 'urn:oid:'):
+        assert value in redacted
+
+
+def test_redacts_phi_in_a_truncated_fhir_patient():
+    for max_chars in range(1, len(PATIENT)):
+        truncated = redact(truncate_payload(PATIENT, max_chars))
+        for value in ('MRN12345', 'Jane', '5551234567', 'Springfield'):
+            assert value not in truncated
+
+
+def test_redacts_unseparated_phone_numbers_but_not_timestamps():
+    assert redact('call 2175550123 or +12175550123') == 'call [PHONE] or [PHONE]'
+    assert redact('since 1718000000, took 0.5551234567 s') == 'since 1718000000, took 0.5551234567 s'
+
+
+def test_truncates_text_mentioning_tags_at_word_boundaries():
+    response = str({'choices': [{'message': {'content': 'Keep eGFR < 30 under review and recheck potassium'}}]})
+    truncated = truncate_payload(response, 60)
+    assert truncated and response.startswith(truncated)
+    assert len(truncated) <= 60
@@ -0,0 +1,44 @@
+import copy
+
+import pytest
+
+from fhir.patient_context import PatientContext, normalize_coded_list
+
+
+def test_normalize_coded_list_sorts_dedupes_and_drops_placeholders():
+    assert normalize_coded_list('Metformin, lisinopril ,  Unknown Medication,metformin') == ('lisinopril', 'Metformin')
+    assert normalize_coded_list(['Gout', None, 'N/A', '', 'asthma']) == ('asthma', 'Gout')
+    assert normalize_coded_list(None) == ()
+    assert normalize_coded_list('No known allergies') == ()
+
+
+def test_normalize_coded_list_picks_one_spelling_whatever_the_order():
+    assert normalize_coded_list(['gout', 'GOUT', 'Gout']) == normalize_coded_list(['Gout', 'gout', 'GOUT']) == ('GOUT',)
+
+
+def test_equivalent_records_share_a_fingerprint():
+    record = PatientContext(age='54', gender='Female', medications='Metformin, Lisinopril',
+                            allergies='No known allergies', conditions=['Type 2 diabetes', 'CKD'],
+                            social_history='None')
+    equivalent = PatientContext(age=54, gender='female', medications=['lisinopril', 'metformin'],
+                                allergies=None, conditions='ckd,type 2  diabetes', social_history=[])
+    different = PatientContext(age=54, gender='female', medications=['lisinopril', 'metformin'],
+                               conditions='ckd, gout')
+
+    assert record.fingerprint == equivalent.fingerprint
+    assert record == equivalent and hash(record) == hash(equivalent)
+    assert record.fingerprint != different.fingerprint
+    assert PatientContext.from_dict(record.to_dict()).fingerprint == record.fingerprint
+    assert copy.copy(record) == record
+
+
+def test_patient_context_is_read_only():
+    context = PatientContext(age=54, conditions=['CKD'])
+    fingerprint = context.fingerprint
+
+    with pytest.raises(AttributeError):
+        context.conditions = ('Gout',)
+    with pytest.raises(AttributeError):
+        del context.age
+    assert context.conditions == ('CKD',)
+    assert context.fingerprint == fingerprint
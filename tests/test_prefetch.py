@@ -0,0 +1,65 @@
+import threading
+
+import flask
+import pytest
+
+from utils import prefetch
+
+
+class SlowFhirClient:
+    release = threading.Event()
+
+    def get_patient_data_by_fhir_id(self, fhir_id):
+        self.release.wait(5)
+        if fhir_id == 'broken':
+            raise Exception('Failed to retrieve patient data, Status Code: 500')
+        return {'id': fhir_id}
+
+
+def test_take_waits_for_a_running_job_and_logs_failures(monkeypatch, caplog):
+    monkeypatch.setattr(prefetch, 'FhirClient', SlowFhirClient)
+    monkeypatch.setattr(prefetch, 'fetch_articles_for_patient', lambda patient_context: ['article'])
+    app = flask.Flask(__name__)
+    prefetcher = prefetch.PatientPrefetcher(max_workers=1)
+
+    with app.app_context(), caplog.at_level('DEBUG'):
+        SlowFhirClient.release.clear()
+        prefetcher.start(app, 'session', 'token', 'patient-1')
+        threading.Timer(0.2, SlowFhirClient.release.set).start()
+        # Still running when the timeout passes, so take keeps waiting instead of discarding it
+        assert prefetcher.take('session', 'patient-1', timeout=0.05) == ({'id': 'patient-1'}, ['article'])
+
+        prefetcher.start(app, 'session', 'token', 'broken')
+        assert prefetcher.take('session', 'broken') is None
+    assert any(record.exc_info and 'broken' in record.getMessage() for record in caplog.records)
+
+
+def test_take_gives_up_on_a_job_that_never_started(monkeypatch):
+    monkeypatch.setattr(prefetch, 'FhirClient', SlowFhirClient)
+    monkeypatch.setattr(prefetch, 'fetch_articles_for_patient', lambda patient_context: [])
+    app = flask.Flask(__name__)
+    prefetcher = prefetch.PatientPrefetcher(max_workers=1)
+
+    with app.app_context():
+        SlowFhirClient.release.clear()
+        prefetcher.start(app, 'first', 'token', 'patient-1')
+        prefetcher.start(app, 'second', 'token', 'patient-2')
+        assert prefetcher.take('second', 'patient-2', timeout=0.05) is None
+        SlowFhirClient.release.set()
+        assert prefetcher.take('first', 'patient-1') == ({'id': 'patient-1'}, [])
+
+
+def test_take_stops_waiting_for_a_hung_job(monkeypatch):
+    monkeypatch.setattr(prefetch, 'FhirClient', SlowFhirClient)
+    monkeypatch.setattr(prefetch, 'fetch_articles_for_patient', lambda patient_context: [])
+    app = flask.Flask(__name__)
+    prefetcher = prefetch.PatientPrefetcher(max_workers=1)
+
+    with app.app_context():
+        SlowFhirClient.release.clear()
+        prefetcher.start(app, 'session', 'token', 'patient-1')
+        job = prefetcher.jobs['session']
+        with pytest.raises(prefetch.PrefetchTimeout):
+            prefetcher.take('session', 'patient-1', timeout=0.05, max_wait=0.1)
+        assert job.cancel_event.is_set()
+        SlowFhirClient.release.set()
@@ -0,0 +1,146 @@
+import io
+
+import pytest
+
+import config
+import utils.pubmed_fetch as pubmed_fetch
+from utils.literature_index import LiteratureIndex
+
+
+def article_xml(pmid, title='Asthma in adults', abstract='<AbstractText>Inhaled steroids help.</AbstractText>'):
+    return (f'<PubmedArticle><MedlineCitation><PMID Version="1">{pmid}</PMID><Article>'
+            f'<ArticleTitle>{title}</ArticleTitle><Abstract>{abstract}</Abstract>'
+            f'</Article></MedlineCitation></PubmedArticle>')
+
+
+def article_set(*articles):
+    return ('<?xml version="1.0" ?><PubmedArticleSet>' + ''.join(articles) + '</PubmedArticleSet>').encode('utf-8')
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.raw = io.BytesIO(content)
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.raw.close()
+
+
+class FakeNcbi:
+    """Answers epost and efetch from the PMIDs it was given, recording every request."""
+
+    def __init__(self):
+        self.requests = []
+        self.posted = {}
+
+    def post(self, url, data=None, stream=False):
+        self.requests.append((url.rsplit('/', 1)[-1], dict(data)))
+        if url.endswith('epost.fcgi'):
+            web_env = f'WEBENV{len(self.posted)}'
+            self.posted[web_env] = data['id'].split(',')
+            return FakeResponse(f'<ePostResult><QueryKey>1</QueryKey><WebEnv>{web_env}</WebEnv></ePostResult>'.encode())
+        if 'id' in data:
+            pmids = data['id'].split(',')
+        else:
+            pmids = self.posted[data['WebEnv']][data['retstart']:data['retstart'] + data['retmax']]
+        return FakeResponse(article_set(*(article_xml(pmid) for pmid in pmids)))
+
+
+@pytest.fixture
+def ncbi(monkeypatch):
+    fake = FakeNcbi()
+    monkeypatch.setattr(pubmed_fetch.requests, 'post', fake.post)
+    monkeypatch.setattr(pubmed_fetch.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(pubmed_fetch, 'api_key', None)
+    return fake
+
+
+def test_small_id_lists_are_fetched_in_one_request(ncbi):
+    articles = list(pubmed_fetch.iter_article_details(['1', '2', '3'], batch_size=5))
+
+    assert [article['pmid'] for article in articles] == ['1', '2', '3']
+    assert [name for name, _ in ncbi.requests] == ['efetch.fcgi']
+    assert ncbi.requests[0][1]['id'] == '1,2,3'
+    assert 'api_key' not in ncbi.requests[0][1]
+
+
+def test_large_id_lists_are_posted_and_fetched_in_chunks(ncbi, monkeypatch):
+    monkeypatch.setattr(config, 'PUBMED_EPOST_MAX_IDS', 5)
+    monkeypatch.setattr(pubmed_fetch, 'api_key', 'KEY')
+    pmids = [str(pmid) for pmid in range(1, 8)]
+
+    articles = list(pubmed_fetch.iter_article_details(pmids, batch_size=2))
+
+    assert [article['pmid'] for article in articles] == pmids
+    assert [(name, data.get('WebEnv'), data.get('retstart'), data.get('retmax')) for name, data in ncbi.requests] == [
+        ('epost.fcgi', None, None, None),
+        ('efetch.fcgi', 'WEBENV0', 0, 2),
+        ('efetch.fcgi', 'WEBENV0', 2, 2),
+        ('efetch.fcgi', 'WEBENV0', 4, 2),
+        ('epost.fcgi', None, None, None),
+        ('efetch.fcgi', 'WEBENV1', 0, 2),
+    ]
+    assert ncbi.posted == {'WEBENV0': pmids[:5], 'WEBENV1': pmids[5:]}
+    assert all(data['api_key'] == 'KEY' and data['db'] == 'pubmed' for _, data in ncbi.requests)
+
+
+def test_efetch_yields_articles_before_the_whole_response_is_read(ncbi, monkeypatch):
+    body = article_set(*(article_xml(pmid, abstract='<AbstractText>' + 'x' * 1000 + '</AbstractText>')
+                         for pmid in range(1, 501)))
+    response = FakeResponse(body)
+    monkeypatch.setattr(pubmed_fetch.requests, 'post', lambda url, data=None, stream=False: response)
+
+    articles = pubmed_fetch.stream_efetch({'id': 'ignored'})
+    assert next(articles)['pmid'] == '1'
+    assert response.raw.tell() < len(body)
+    assert len(list(articles)) == 499
+
+
+def test_parses_labelled_abstract_sections_and_inline_markup():
+    element = pubmed_fetch.ET.fromstring(article_xml(
+        '42', title='Gout and <i>ABCG2</i> variants',
+        abstract='<AbstractText Label="BACKGROUND">Urate <sup>+</sup> levels.</AbstractText>'
+                 '<AbstractText Label="RESULTS">Flares fell.</AbstractText>'
+                 '<AbstractText/>'))
+
+    assert pubmed_fetch.parse_pubmed_article(element) == {
+        'pmid': '42',
+        'title': 'Gout and ABCG2 variants',
+        'abstract': 'BACKGROUND: Urate + levels.\nRESULTS: Flares fell.',
+    }
+
+
+def test_missing_or_empty_title_and_abstract_use_placeholders():
+    empty = pubmed_fetch.ET.fromstring(article_xml('7', title='', abstract=''))
+    missing = pubmed_fetch.ET.fromstring('<PubmedArticle><MedlineCitation><PMID>8</PMID></MedlineCitation></PubmedArticle>')
+
+    for element, pmid in ((empty, '7'), (missing, '8')):
+        assert pubmed_fetch.parse_pubmed_article(element) == {
+            'pmid': pmid, 'title': 'No title available', 'abstract': 'No abstract available'}
+
+
+def test_esearch_sends_api_key_only_when_set(tmp_path, monkeypatch):
+    index = LiteratureIndex(str(tmp_path)).load()
+    monkeypatch.setattr(pubmed_fetch, 'get_literature_index', lambda: index)
+    requests_made = []
+
+    def fake_get(url, params=None):
+        requests_made.append((url, params))
+        return FakeResponse(b'<eSearchResult><IdList><Id>42</Id></IdList></eSearchResult>')
+
+    monkeypatch.setattr(pubmed_fetch.requests, 'get', fake_get)
+    monkeypatch.setattr(pubmed_fetch.time, 'sleep', lambda seconds: None)
+    for key in (None, 'KEY'):
+        monkeypatch.setattr(pubmed_fetch, 'api_key', key)
+        assert pubmed_fetch.fetch_pubmed_data(50, 'female', conditions=['Asthma']) == ['42']
+
+    assert 'api_key' not in requests_made[0][1]
+    assert requests_made[1][1]['api_key'] == 'KEY'
+    assert all('apikey' not in url and url.endswith('esearch.fcgi') for url, _ in requests_made)
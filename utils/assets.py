@@ -0,0 +1,251 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_FILE = 'manifest.json'
+# Fingerprinted paths written by each recent build, oldest first
+GENERATIONS_FILE = 'generations.json'
+# Only these asset types are minified and fingerprinted; everything else is copied as is
+FINGERPRINTED_EXTENSIONS = ('.js', '.css')
+PRECOMPRESSED_EXTENSIONS = ('.js', '.css', '.html', '.txt', '.svg', '.json')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+IDENTIFIER_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+# A '/' after one of these (or at the start) begins a regex literal rather than a division
+REGEX_PRECEDERS = frozenset('(,=:[!&|?{};+-*%<>~^')
+# ... and so does a '/' after one of these keywords
+REGEX_KEYWORDS = frozenset(['return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new',
+                            'delete', 'void', 'throw', 'yield', 'await', 'of'])
+LAST_WORD_RE = re.compile(r'[A-Za-z_$][\w$]*$')
+CSS_STRING_RE = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+
+
+def minify_js(source):
+    """
+    Strips comments and redundant whitespace from JavaScript. Strings, template literals and
+    regex literals are copied verbatim; line breaks are kept so automatic semicolon insertion
+    behaves as before.
+    """
+    out = []
+    i = 0
+    n = len(source)
+    pending_space = pending_newline = False
+
+    def last_significant():
+        for char in reversed(out):
+            if char.strip():
+                return char[-1]
+        return ''
+
+    def starts_regex():
+        prev = last_significant()
+        if not prev or prev in REGEX_PRECEDERS:
+            return True
+        word = LAST_WORD_RE.search(''.join(out[-12:]).rstrip())
+        return word is not None and word.group() in REGEX_KEYWORDS
+
+    def flush_whitespace(next_char):
+        nonlocal pending_space, pending_newline
+        prev = out[-1][-1] if out else ''
+        if pending_newline and out:
+            out.append('\n')
+        elif pending_space and (prev in IDENTIFIER_CHARS and next_char in IDENTIFIER_CHARS
+                                or prev + next_char in ('++', '--', '+-', '-+')):
+            out.append(' ')
+        pending_space = pending_newline = False
+
+    while i < n:
+        char = source[i]
+        if char in ' \t\r\n':
+            pending_space = True
+            pending_newline = pending_newline or char == '\n'
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            pending_space = True
+        elif char in '\'"`' or (char == '/' and starts_regex()):
+            flush_whitespace(char)
+            start = i
+            i += 1
+            in_class = False
+            while i < n:
+                if source[i] == '\\':
+                    i += 2
+                    continue
+                if char == '/':
+                    if source[i] == '[':
+                        in_class = True
+                    elif source[i] == ']':
+                        in_class = False
+                    elif source[i] == '/' and not in_class:
+                        break
+                elif source[i] == char:
+                    break
+                i += 1
+            i += 1
+            out.append(source[start:i])
+        else:
+            flush_whitespace(char)
+            out.append(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    """Strips comments and redundant whitespace from CSS, leaving quoted strings untouched."""
+    # Drop comments in the same pass that skips strings, so '/*' inside a string survives
+    source = re.sub(r'/\*.*?\*/|(' + CSS_STRING_RE + ')', lambda match: match.group(1) or '', source, flags=re.S)
+    parts = re.split('(' + CSS_STRING_RE + ')', source)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r'\s*([{};,])\s*', r'\1', part)
+        part = re.sub(r':\s+', ':', part)
+        parts[index] = part.replace(';}', '}')
+    return ''.join(parts).strip() + '\n'
+
+
+def minify_html(source):
+    """Collapses whitespace and drops comments, leaving <pre>, <textarea>, <script> and <style> bodies alone."""
+    parts = re.split(r'(<(pre|textarea|script|style)\b.*?</\2>)', source, flags=re.S | re.I)
+    out = []
+    for index, part in enumerate(parts):
+        if index % 3 == 2:
+            continue  # tag name captured by the inner group
+        if index % 3 == 1:
+            out.append(part)
+            continue
+        part = re.sub(r'<!--(?!\[if).*?-->', '', part, flags=re.S)
+        part = re.sub(r'>\s+<', '><', part)
+        part = re.sub(r'\s+', ' ', part)
+        out.append(part)
+    return ''.join(out).strip() + '\n'
+
+
+def fingerprint_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def write_compressed(path, content):
+    """Writes .gz (and .br when brotli is installed) next to path so they can be served as is."""
+    with open(path + '.gz', 'wb') as file:
+        file.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as file:
+            file.write(brotli.compress(content, quality=11))
+
+
+def build_assets(static_dir, templates_dir, build_dir, keep_generations=3):
+    """
+    Builds the production assets into build_dir:
+
+    - static/: copies of the static files, with JS and CSS minified and renamed by content
+      hash, plus precompressed .gz/.br variants of text assets
+    - templates/: minified templates, picked up ahead of the originals in PRODUCTION
+    - manifest.json: maps each original static path to its fingerprinted path
+    - generations.json: the fingerprinted paths of the last keep_generations builds
+
+    Fingerprinted files from the previous keep_generations - 1 builds are kept in static/, so
+    pages rendered or cached before a deploy can still load the assets they reference.
+    Returns the manifest.
+    """
+    build_static = os.path.join(build_dir, 'static')
+    build_templates = os.path.join(build_dir, 'templates')
+    new_static = build_static + '.tmp'
+    for path in (new_static, build_templates):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+    manifest = {}
+    templates_dir = os.path.abspath(templates_dir)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != templates_dir)
+        for name in sorted(files):
+            source_path = os.path.join(root, name)
+            rel_path = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            with open(source_path, 'rb') as file:
+                content = file.read()
+
+            ext = os.path.splitext(name)[1].lower()
+            if ext in FINGERPRINTED_EXTENSIONS:
+                minify = minify_js if ext == '.js' else minify_css
+                content = minify(content.decode('utf-8')).encode('utf-8')
+                manifest[rel_path] = fingerprint_name(rel_path, content)
+                rel_path = manifest[rel_path]
+
+            target_path = os.path.join(new_static, rel_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, 'wb') as file:
+                file.write(content)
+            if ext in PRECOMPRESSED_EXTENSIONS:
+                write_compressed(target_path, content)
+
+    for name in sorted(os.listdir(templates_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(templates_dir, name), 'r', encoding='utf-8') as file:
+                content = minify_html(file.read())
+            with open(os.path.join(build_templates, name), 'w', encoding='utf-8') as file:
+                file.write(content)
+
+    generations = load_generations(build_dir)[-(keep_generations - 1):] if keep_generations > 1 else []
+    for generation in generations:
+        for rel_path in generation:
+            for suffix in ('', '.gz', '.br'):
+                old_path = os.path.join(build_static, rel_path + suffix)
+                target_path = os.path.join(new_static, rel_path + suffix)
+                if os.path.isfile(old_path) and not os.path.exists(target_path):
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    shutil.copy2(old_path, target_path)
+    generations.append(sorted(manifest.values()))
+
+    # Swap the new static/ in with two renames, so it is never served half-written
+    if os.path.exists(build_static):
+        old_static = build_static + '.old'
+        if os.path.exists(old_static):
+            shutil.rmtree(old_static)
+        os.rename(build_static, old_static)
+        os.rename(new_static, build_static)
+        shutil.rmtree(old_static)
+    else:
+        os.rename(new_static, build_static)
+
+    with open(os.path.join(build_dir, MANIFEST_FILE), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    with open(os.path.join(build_dir, GENERATIONS_FILE), 'w', encoding='utf-8') as file:
+        json.dump(generations, file, indent=2)
+    return manifest
+
+
+def load_manifest(build_dir):
+    path = os.path.join(build_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_generations(build_dir):
+    """
+    Returns the fingerprinted paths of recent builds, oldest first. Builds from before
+    generations were recorded count as a single generation taken from their manifest.
+    """
+    path = os.path.join(build_dir, GENERATIONS_FILE)
+    if not os.path.exists(path):
+        manifest = load_manifest(build_dir)
+        return [sorted(manifest.values())] if manifest else []
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
@@ -0,0 +1,85 @@
+import gzip
+import mimetypes
+import os
+import jinja2
+from flask import request, send_from_directory
+from utils.assets import brotli, load_generations, load_manifest, IMMUTABLE_CACHE_CONTROL
+
+# Encodings in order of preference, with the suffix of their precompressed files
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encoding(available=('br', 'gzip')):
+    """Returns the best encoding from available that the client accepts, or None."""
+    for encoding, _ in ENCODINGS:
+        if encoding in available and request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, app):
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=app.config['GZIP_LEVEL'])
+
+
+def init_http_caching(app):
+    """
+    Serves fingerprinted, precompressed assets from MIN_DIR in PRODUCTION and compresses
+    JSON and HTML responses for clients that accept gzip or brotli.
+    """
+    manifest = {}
+    generations = []
+    if app.config['PRODUCTION']:
+        manifest = load_manifest(app.config['MIN_DIR'])
+        generations = load_generations(app.config['MIN_DIR'])
+        if manifest:
+            app.static_folder = os.path.join(app.config['MIN_DIR'], 'static')
+            app.jinja_loader = jinja2.ChoiceLoader([
+                jinja2.FileSystemLoader([os.path.join(app.config['MIN_DIR'], 'templates')]),
+                app.jinja_loader,
+            ])
+        else:
+            app.logger.warning("PRODUCTION is set but no asset build was found; run build.py")
+    # Files of earlier builds are kept for pages rendered before a deploy; they never change either
+    fingerprinted = frozenset(manifest.values()).union(*generations)
+    live_encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_static(filename):
+        # Prefer a precompressed copy written by the build
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] > 0 and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = app.send_static_file(filename)
+        response.vary.add('Accept-Encoding')
+        if filename in fingerprinted:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = serve_static
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = accepted_encoding(live_encodings)
+        data = response.get_data()
+        if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, app))
+        response.headers['Content-Encoding'] = encoding
+        return response
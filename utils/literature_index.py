@@ -0,0 +1,552 @@
+import array
+import atexit
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# BM25 tuning parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in',
+    'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were',
+    'with', 'no', 'not', 'known', 'unknown', 'none',
+])
+
+# Each segment is an immutable directory of these files; the manifest lists the live segments
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.lock'
+DOCS_FILE = 'docs.json'  # [pmid, length] per document
+LEXICON_FILE = 'lexicon.json'
+POSTINGS_FILE = 'postings.bin'
+TEXT_FILE = 'text.bin'  # JSON [title, abstract] per document, back to back
+TEXT_OFFSETS_FILE = 'text_offsets.bin'  # little-endian uint64 start of each document in text.bin, plus the end
+TEXT_OFFSET_PAIR = struct.Struct('<QQ')
+
+# Placeholders parse_pubmed_article stores for missing fields; they are not indexed
+NO_TITLE = 'No title available'
+NO_ABSTRACT = 'No abstract available'
+PLACEHOLDER_TEXTS = frozenset([NO_TITLE, NO_ABSTRACT])
+
+
+def tokenize(text):
+    """Lowercase text and split it into indexable terms."""
+    if not text:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = ' '.join(str(t) for t in text)
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_postings(postings):
+    """Encode a sorted list of (doc_num, tf) pairs as delta-gapped varints."""
+    out = bytearray()
+    last = 0
+    for doc_num, tf in postings:
+        encode_varint(doc_num - last, out)
+        encode_varint(tf, out)
+        last = doc_num
+    return out
+
+
+def decode_postings(buf, start, end, base=0):
+    """Decode the postings in buf[start:end], adding base to every document number."""
+    postings = []
+    data = buf[start:end]
+    pos = 0
+    doc_num = base
+    end = len(data)
+    # Varints are decoded inline: this loop runs for every posting of every query term
+    while pos < end:
+        byte = data[pos]
+        pos += 1
+        gap = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            gap |= (byte & 0x7F) << shift
+            shift += 7
+        byte = data[pos]
+        pos += 1
+        tf = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            tf |= (byte & 0x7F) << shift
+            shift += 7
+        doc_num += gap
+        postings.append((doc_num, tf))
+    return postings
+
+
+class Segment:
+    """
+    An immutable, memory-mapped slice of the index whose documents start at global number base.
+    Only the lexicon is held in memory; postings and document text are read from the maps.
+    """
+
+    __slots__ = ('name', 'base', 'lexicon', '_files', '_postings', '_text', '_offsets')
+
+    def __init__(self, name, base, lexicon, path):
+        self.name = name
+        self.base = base
+        self.lexicon = lexicon  # term -> [offset, nbytes, df] in postings.bin
+        self._files = []
+        self._postings = self._map(os.path.join(path, POSTINGS_FILE))
+        self._text = self._map(os.path.join(path, TEXT_FILE))
+        self._offsets = self._map(os.path.join(path, TEXT_OFFSETS_FILE))
+
+    def _map(self, file_path):
+        if os.path.getsize(file_path) == 0:
+            return None
+        file = open(file_path, 'rb')
+        self._files.append(file)
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, index_dir, name, base):
+        """Returns (segment, docs) for the segment directory name, with docs as [pmid, length] pairs."""
+        path = os.path.join(index_dir, name)
+        with open(os.path.join(path, DOCS_FILE), 'r', encoding='utf-8') as file:
+            docs = json.load(file)
+        with open(os.path.join(path, LEXICON_FILE), 'r', encoding='utf-8') as file:
+            lexicon = json.load(file)
+        return cls(name, base, lexicon, path), docs
+
+    @staticmethod
+    def write(index_dir, name, docs, postings_by_term, base):
+        """
+        Writes a new segment directory from [pmid, length, title, abstract] docs.
+        postings_by_term holds global document numbers.
+        """
+        path = os.path.join(index_dir, name)
+        tmp_path = path + '.tmp'
+        os.makedirs(tmp_path)
+        postings_data = bytearray()
+        lexicon = {}
+        for term in sorted(postings_by_term):
+            postings = [(doc_num - base, tf) for doc_num, tf in postings_by_term[term]]
+            encoded = encode_postings(postings)
+            lexicon[term] = [len(postings_data), len(encoded), len(postings)]
+            postings_data += encoded
+        text_data = bytearray()
+        offsets = array.array('Q', [0])
+        for _, _, title, abstract in docs:
+            text_data += json.dumps([title, abstract], separators=(',', ':')).encode('utf-8')
+            offsets.append(len(text_data))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        with open(os.path.join(tmp_path, POSTINGS_FILE), 'wb') as file:
+            file.write(postings_data)
+        with open(os.path.join(tmp_path, TEXT_FILE), 'wb') as file:
+            file.write(text_data)
+        with open(os.path.join(tmp_path, TEXT_OFFSETS_FILE), 'wb') as file:
+            offsets.tofile(file)
+        with open(os.path.join(tmp_path, LEXICON_FILE), 'w', encoding='utf-8') as file:
+            json.dump(lexicon, file, separators=(',', ':'))
+        with open(os.path.join(tmp_path, DOCS_FILE), 'w', encoding='utf-8') as file:
+            json.dump([doc[:2] for doc in docs], file, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def postings(self, term):
+        entry = self.lexicon.get(term)
+        if entry is None or self._postings is None:
+            return []
+        offset, nbytes, _ = entry
+        return decode_postings(self._postings, offset, offset + nbytes, self.base)
+
+    def document_frequency(self, term):
+        entry = self.lexicon.get(term)
+        return entry[2] if entry else 0
+
+    def document(self, doc_num):
+        """Returns (title, abstract) for the global document number doc_num."""
+        # Consecutive offsets bound the document; each is 8 bytes
+        start, end = TEXT_OFFSET_PAIR.unpack_from(self._offsets, 8 * (doc_num - self.base))
+        return tuple(json.loads(self._text[start:end].decode('utf-8')))
+
+    def close(self):
+        for mapped in (self._postings, self._text, self._offsets):
+            if mapped is not None:
+                mapped.close()
+        self._postings = self._text = self._offsets = None
+        for file in self._files:
+            file.close()
+        self._files = []
+
+
+class LiteratureIndex:
+    """
+    BM25 inverted index over PubMed titles and abstracts that have already been fetched.
+
+    The index on disk is a set of immutable segments with delta/varint encoded postings and
+    the article text, both memory-mapped on load; only PMIDs and document lengths are held
+    in memory. Newly added articles are searchable at once and are written out
+    as a new segment by a background thread once flush_docs articles or flush_interval
+    seconds have accumulated. The manifest naming the live segments is swapped atomically
+    under a file lock, so worker processes never see a half-written index or lose each
+    other's segments. Segments are merged once there are more than max_segments.
+    """
+
+    def __init__(self, index_dir, flush_docs=50, flush_interval=30, max_segments=8):
+        self.index_dir = index_dir
+        self.flush_docs = flush_docs
+        self.flush_interval = flush_interval
+        self.max_segments = max_segments
+        self.pmids = []  # pmid per global document number
+        self.lengths = []  # indexed term count per global document number
+        self.unflushed = {}  # document number -> (title, abstract) not yet in a segment
+        self.doc_nums = {}  # pmid -> document number
+        self.segments = []
+        self.shadowed = set()  # document numbers of PMIDs another worker indexed first
+        self.pending = {}  # term -> [(doc_num, tf)] not yet handed to a flush
+        self.flushing = {}  # term -> [(doc_num, tf)] being written as a segment
+        self.flushed_docs = 0  # documents covered by self.segments
+        self.total_length = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flush_wanted = threading.Event()
+        self._flusher = None
+        self._pending_since = None
+
+    def __len__(self):
+        return len(self.doc_nums)
+
+    def __contains__(self, pmid):
+        return pmid in self.doc_nums
+
+    def load(self):
+        """Loads the segments named in the manifest, dropping anything not yet flushed."""
+        with self._lock:
+            for attempt in range(3):
+                try:
+                    self._load_segments(self._read_manifest())
+                    break
+                except FileNotFoundError:
+                    # A concurrent compaction removed a segment between reading the manifest and opening it
+                    if attempt == 2:
+                        raise
+        return self
+
+    def _load_segments(self, names):
+        segments, pmids, lengths, doc_nums, shadowed = [], [], [], {}, set()
+        try:
+            for name in names:
+                segment, segment_docs = Segment.open(self.index_dir, name, len(pmids))
+                segments.append(segment)
+                for pmid, length in segment_docs:
+                    if pmid in doc_nums:
+                        shadowed.add(len(pmids))
+                    else:
+                        doc_nums[pmid] = len(pmids)
+                    pmids.append(pmid)
+                    lengths.append(length)
+        except Exception:
+            for segment in segments:
+                segment.close()
+            raise
+        self.close()
+        self.segments, self.pmids, self.lengths, self.doc_nums, self.shadowed = segments, pmids, lengths, doc_nums, shadowed
+        self.total_length = sum(length for num, length in enumerate(lengths) if num not in shadowed)
+        self.flushed_docs = len(pmids)
+        self.pending, self.flushing, self.unflushed = {}, {}, {}
+        self._pending_since = None
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+                return json.load(file)['segments']
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, names):
+        path = os.path.join(self.index_dir, MANIFEST_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'segments': names}, file)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+    def add_article(self, pmid, title, abstract):
+        """Index a single article. Returns False if the PMID is already indexed."""
+        if not pmid:
+            return False
+        pmid = str(pmid)
+        with self._lock:
+            if pmid in self.doc_nums:
+                return False
+            terms = [term for text in (title, abstract) if text not in PLACEHOLDER_TEXTS for term in tokenize(text)]
+            doc_num = len(self.pmids)
+            self.pmids.append(pmid)
+            self.lengths.append(len(terms))
+            self.unflushed[doc_num] = (title, abstract)
+            self.doc_nums[pmid] = doc_num
+            self.total_length += len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                self.pending.setdefault(term, []).append((doc_num, tf))
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            return True
+
+    def add_articles(self, articles):
+        """Index articles (dicts with 'pmid', 'title' and 'abstract'). Returns the number added."""
+        added = 0
+        for article in articles:
+            if self.add_article(article.get('pmid'), article.get('title'), article.get('abstract')):
+                added += 1
+        return added
+
+    def _postings_for(self, term):
+        postings = []
+        for segment in self.segments:
+            postings += segment.postings(term)
+        postings += self.flushing.get(term, []) + self.pending.get(term, [])
+        if self.shadowed:
+            postings = [posting for posting in postings if posting[0] not in self.shadowed]
+        return postings
+
+    def document_frequency(self, term):
+        return (sum(segment.document_frequency(term) for segment in self.segments)
+                + len(self.flushing.get(term, ())) + len(self.pending.get(term, ())))
+
+    def coverage(self, text):
+        """Fraction of distinct query terms that appear in at least one indexed article."""
+        terms = set(tokenize(text))
+        if not terms:
+            return 0.0
+        with self._lock:
+            return sum(1 for term in terms if self.document_frequency(term)) / len(terms)
+
+    def search(self, text, max_results=10, required=None, min_coverage=1.0):
+        """
+        Rank indexed articles against the query text with BM25. Returns [(pmid, score)].
+
+        When required text is given, only articles containing at least min_coverage of its
+        distinct terms are ranked. The hits are counted from the postings decoded for scoring.
+        """
+        terms = tokenize(text)
+        required_terms = set(tokenize(required)) if required else set()
+        with self._lock:
+            n_docs = len(self.pmids)
+            if not terms or not n_docs:
+                return []
+            avg_length = self.total_length / n_docs or 1.0
+            scores = {}
+            required_hits = {}
+            for term in set(terms) | required_terms:
+                postings = self._postings_for(term)
+                if not postings:
+                    continue
+                if term in required_terms:
+                    for doc_num, _ in postings:
+                        required_hits[doc_num] = required_hits.get(doc_num, 0) + 1
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                weight = idf * terms.count(term)
+                for doc_num, tf in postings:
+                    length = self.lengths[doc_num]
+                    norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+                    scores[doc_num] = scores.get(doc_num, 0.0) + weight * norm
+            if required_terms:
+                min_hits = min_coverage * len(required_terms)
+                scores = {doc_num: score for doc_num, score in scores.items()
+                          if required_hits.get(doc_num, 0) >= min_hits}
+            ranked = heapq.nsmallest(max_results, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [(self.pmids[doc_num], score) for doc_num, score in ranked]
+
+    def get_article(self, pmid):
+        with self._lock:
+            doc_num = self.doc_nums.get(str(pmid))
+            if doc_num is None:
+                return None
+            title, abstract = self._document(doc_num)
+            return {'pmid': self.pmids[doc_num], 'title': title, 'abstract': abstract}
+
+    def _document(self, doc_num):
+        """Returns (title, abstract) for doc_num from memory if unflushed, else from its segment."""
+        if doc_num in self.unflushed:
+            return self.unflushed[doc_num]
+        for segment in reversed(self.segments):
+            if doc_num >= segment.base:
+                return segment.document(doc_num)
+        raise KeyError(doc_num)
+
+    def schedule_flush(self):
+        """
+        Asks the background flusher to write pending articles once flush_docs of them have
+        accumulated or the oldest has waited flush_interval seconds. Never blocks.
+        """
+        with self._lock:
+            if self._pending_since is None:
+                return
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name='literature-index-flush', daemon=True)
+                self._flusher.start()
+            if len(self.pmids) - self.flushed_docs >= self.flush_docs:
+                self._flush_wanted.set()
+
+    def _flush_loop(self):
+        while True:
+            self._flush_wanted.wait(self.flush_interval)
+            self._flush_wanted.clear()
+            with self._lock:
+                due = self._pending_since is not None and (
+                    len(self.pmids) - self.flushed_docs >= self.flush_docs
+                    or time.monotonic() - self._pending_since >= self.flush_interval)
+            if due:
+                try:
+                    self.save()
+                except Exception:
+                    # Pending articles stay searchable and are retried on the next flush
+                    pass
+
+    def save(self):
+        """Writes pending articles to disk as a new segment, merging segments when there are too many."""
+        with self._flush_lock:
+            with self._lock:
+                if not self.pending:
+                    return
+                self.flushing, self.pending = self.pending, {}
+                self._pending_since = None
+                start, end = self.flushed_docs, len(self.pmids)
+                docs = [[self.pmids[num], self.lengths[num], *self.unflushed[num]] for num in range(start, end)]
+                flushing = self.flushing
+
+            os.makedirs(self.index_dir, exist_ok=True)
+            name = f"segment-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            try:
+                Segment.write(self.index_dir, name, docs, flushing, start)
+            except Exception:
+                with self._lock:
+                    # Hand the articles back so the next flush retries them
+                    for term, postings in flushing.items():
+                        self.pending[term] = postings + self.pending.get(term, [])
+                    self.flushing = {}
+                    self._pending_since = time.monotonic()
+                raise
+
+            with self._file_lock():
+                names = self._read_manifest()
+                in_sync = names == [segment.name for segment in self.segments]
+                names.append(name)
+                self._write_manifest(names)
+                if in_sync:
+                    with self._lock:
+                        segment, _ = Segment.open(self.index_dir, name, start)
+                        self.segments.append(segment)
+                        self.flushed_docs = end
+                        self.flushing = {}
+                        for num in range(start, end):
+                            del self.unflushed[num]
+                else:
+                    # Another worker added segments; reload so document numbers match the disk
+                    self._reload_keeping(end)
+                if len(names) > self.max_segments:
+                    self._compact()
+
+    def _reload_keeping(self, flushed_end):
+        """Reloads from disk, re-adding articles added after flushed_end that are not on disk yet."""
+        with self._lock:
+            unflushed = [(self.pmids[num], *self.unflushed[num]) for num in range(flushed_end, len(self.pmids))]
+            self.load()
+            for pmid, title, abstract in unflushed:
+                self.add_article(pmid, title, abstract)
+
+    def _compact(self):
+        """Merges all segments into one. Must be called with the file lock held."""
+        with self._lock:
+            end = self.flushed_docs
+            docs = [[self.pmids[num], self.lengths[num], *self._document(num)]
+                    for num in range(end) if num not in self.shadowed]
+            renumber = {}
+            for num in range(end):
+                if num not in self.shadowed:
+                    renumber[num] = len(renumber)
+            postings_by_term = {}
+            for segment in self.segments:
+                for term in segment.lexicon:
+                    postings_by_term.setdefault(term, []).extend(
+                        (renumber[doc_num], tf) for doc_num, tf in segment.postings(term) if doc_num in renumber)
+            old_names = [segment.name for segment in self.segments]
+
+        name = f"segment-{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        Segment.write(self.index_dir, name, docs, postings_by_term, 0)
+        self._write_manifest([name])
+        self._reload_keeping(end)
+        for old_name in old_names:
+            shutil.rmtree(os.path.join(self.index_dir, old_name), ignore_errors=True)
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.index_dir, LOCK_FILE))
+
+
+class _FileLock:
+    """Exclusive lock across worker processes; a no-op where fcntl is unavailable."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_literature_index(index_dir=None):
+    """Return the process-wide literature index, loading it from disk on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            import config
+            _index = LiteratureIndex(
+                index_dir or config.PUBMED_INDEX_DIR,
+                flush_docs=config.PUBMED_INDEX_FLUSH_DOCS,
+                flush_interval=config.PUBMED_INDEX_FLUSH_INTERVAL,
+                max_segments=config.PUBMED_INDEX_MAX_SEGMENTS,
+            ).load()
+            # Write out articles fetched since the last flush when the process exits
+            atexit.register(_index.save)
+        return _index
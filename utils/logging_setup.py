@@ -0,0 +1,183 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+
+# Secrets in query strings, form bodies and headers
+SECRET_PATTERNS = [
+    (re.compile(r'(?i)\b(api_?key|access_token|refresh_token|id_token|client_secret|code_verifier|code)=([^&\s"\']+)'), r'\1=[REDACTED]'),
+    (re.compile(r'(?i)\bBearer\s+[A-Za-z0-9\-._~+/]+=*'), 'Bearer [REDACTED]'),
+    (re.compile(r'(?i)(["\'](?:access_token|refresh_token|id_token|client_secret|api_key)["\']\s*:\s*["\'])[^"\']*'), r'\1[REDACTED]'),
+]
+
+# Child elements of a FHIR name or address whose values identify the patient
+NAME_ADDRESS_PARTS = r'(?:text|given|family|prefix|suffix|line|city|district|state|postalCode)'
+# A FHIR element and its children, up to the closing tag or the end of a truncated payload
+FHIR_BLOCK = r'<({})\b[^>]*(?<!/)>.*?(?:</\1>|\Z)'
+VALUE_ATTR_RE = r'value="[^"]*"'
+
+
+def _redact_values(element_re):
+    """Returns a replacement that masks the value attribute of element_re children within a block."""
+    element_re = re.compile(r'(<' + element_re + r'\b[^>]*)' + VALUE_ATTR_RE)
+    return lambda match: element_re.sub(r'\1value="[REDACTED]"', match.group(0))
+
+
+# Identifiers that count as PHI wherever they appear in a log line
+PHI_PATTERNS = [
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '[EMAIL]'),
+    (re.compile(r'\b\d{3}-\d{2}-\d{4}\b'), '[SSN]'),
+    (re.compile(r'(?<!\d)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]\d{3}[\s.-]\d{4}(?!\d)'), '[PHONE]'),
+    # Unseparated US numbers; the area code and exchange can't start with 0 or 1, which keeps out timestamps
+    (re.compile(r'(?<![\d.])(?:\+?1)?[2-9]\d{2}[2-9]\d{6}(?![\d.])'), '[PHONE]'),
+    (re.compile(r'\b(?:19|20)\d{2}-\d{2}-\d{2}\b(?!T)'), '[DATE]'),
+    # FHIR XML: name and address parts, and the <value> of identifiers (MRNs) and telecoms
+    (re.compile(FHIR_BLOCK.format('name|address'), re.S), _redact_values(NAME_ADDRESS_PARTS)),
+    (re.compile(FHIR_BLOCK.format('identifier|telecom'), re.S), _redact_values('value')),
+    # Elements that carry the value themselves, also when the enclosing block was truncated away
+    (re.compile(r'<(name|given|family|birthDate|line|city|district|postalCode)\b[^>]*value="[^"]*"'), r'<\1 value="[REDACTED]"'),
+    # Display names of the people a resource refers to
+    (re.compile(r'<(subject|patient|performer|recorder|requester|asserter)>(\s*<reference value="[^"]*"/>)?\s*<display value="[^"]*"'),
+     r'<\1><display value="[REDACTED]"'),
+]
+
+STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+# Payload limits, taken from app.config by configure_logging
+_payload_max_chars = 2000
+_payload_sample_rate = 1.0
+
+
+def redact(text):
+    """Masks tokens, API keys and common PHI identifiers in text."""
+    text = str(text)
+    for pattern, replacement in SECRET_PATTERNS + PHI_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Redacts the fully formatted message, so arguments are covered, and any `extra` fields."""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in vars(record).items():
+            if key not in STANDARD_RECORD_ATTRS and isinstance(value, str):
+                setattr(record, key, redact(value))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Emits one JSON object per record, including any `extra` fields."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = redact(self.formatException(record.exc_info))
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking or erroring when the log queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def truncate_payload(text, max_chars):
+    """
+    Cuts text to at most max_chars without splitting a tag (for markup) or word (for
+    anything else), so the redaction patterns still see complete values such as
+    <family value="..."/>.
+    """
+    is_markup = text.lstrip().startswith('<')
+    text = text[:max_chars]
+    boundary = text.rfind('>') + 1 if is_markup else max(text.rfind(' '), text.rfind(','))
+    return text[:boundary] if boundary > 0 else ''
+
+
+def log_payload(logger, label, payload, level=logging.DEBUG, **fields):
+    """
+    Logs a large payload (FHIR bundle, API response) truncated to LOG_PAYLOAD_MAX_CHARS and
+    sampled at LOG_PAYLOAD_SAMPLE_RATE, as configured by configure_logging. Nothing is
+    formatted unless the level is enabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if _payload_sample_rate < 1 and random.random() >= _payload_sample_rate:
+        return
+    text = payload if isinstance(payload, str) else str(payload)
+    size = len(text)
+    if size > _payload_max_chars:
+        text = truncate_payload(text, _payload_max_chars)
+        text += f"... [truncated {size - len(text)} chars]"
+    # stacklevel=2 attributes the record to the caller rather than this helper
+    logger.log(level, "%s: %s", label, text, extra=dict(fields, payload_size=size), stacklevel=2)
+
+
+def configure_logging(app, handlers=None):
+    """
+    Routes the app's log records through a queue so formatting, redaction and I/O happen on
+    a background thread instead of the request thread. Returns the queue listener.
+    """
+    global _listener, _payload_max_chars, _payload_sample_rate
+    if _listener is not None:
+        _listener.stop()
+    _payload_max_chars = app.config.get('LOG_PAYLOAD_MAX_CHARS', 2000)
+    _payload_sample_rate = app.config.get('LOG_PAYLOAD_SAMPLE_RATE', 1.0)
+
+    if handlers is None:
+        handler = logging.StreamHandler(sys.stderr)
+        if app.config.get('LOG_FILE'):
+            handler = logging.FileHandler(app.config['LOG_FILE'])
+        handlers = [handler]
+    for handler in handlers:
+        handler.addFilter(RedactingFilter())
+        if app.config.get('LOG_JSON', True):
+            handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=app.config.get('LOG_QUEUE_SIZE', 10000))
+    queue_handler = DroppingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(app.config.get('LOG_LEVEL', 'DEBUG' if app.debug else 'INFO'))
+
+    # Let Flask's logger propagate to the queue instead of writing synchronously itself
+    from flask.logging import default_handler
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(logging.NOTSET)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flushes queued records and stops the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
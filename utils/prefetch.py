@@ -0,0 +1,126 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError
+from flask import current_app
+from fhir.fhir_client import FhirClient
+from utils.pubmed_fetch import fetch_articles_for_patient
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class PrefetchTimeout(Exception):
+    pass
+
+
+class PrefetchJob:
+    def __init__(self, fhir_id):
+        self.fhir_id = fhir_id
+        self.created = time.monotonic()
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise PrefetchCancelled(f"Prefetch for patient {self.fhir_id} was cancelled")
+
+
+class PatientPrefetcher:
+    """
+    Warms a patient's FHIR resources and PubMed articles in the background right after
+    the OAuth callback, so /handle-fhir-id can reuse them instead of starting cold.
+
+    At most one job is kept per session key; starting a job for another patient cancels
+    the previous one. Work runs on a bounded thread pool.
+    """
+
+    def __init__(self, max_workers=4, ttl=600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.ttl = ttl
+        self.jobs = {}  # session key -> PrefetchJob
+        self._lock = threading.Lock()
+
+    def start(self, app, key, access_token, fhir_id):
+        """Start warming fhir_id for the session key, cancelling any other patient's job."""
+        with self._lock:
+            self._prune()
+            job = self.jobs.get(key)
+            if job is not None:
+                if job.fhir_id == fhir_id and not job.cancel_event.is_set():
+                    return job
+                job.cancel()
+
+            job = PrefetchJob(fhir_id)
+            job.future = self.executor.submit(self._run, app, job, access_token)
+            self.jobs[key] = job
+            return job
+
+    def cancel(self, key):
+        with self._lock:
+            job = self.jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def take(self, key, fhir_id, timeout=30, max_wait=120):
+        """
+        Return the warmed (patient_context, articles) for fhir_id. Returns None if there is
+        nothing usable, cancelling jobs that were started for a different patient.
+
+        A job still waiting for a worker after timeout seconds is cancelled so the caller can
+        fetch in the foreground; a job already running is waited on for up to max_wait seconds
+        in total, since starting over would only repeat the work it has done. Raises
+        PrefetchTimeout, after cancelling the job, if it is still running by then.
+        """
+        with self._lock:
+            job = self.jobs.pop(key, None)
+        if job is None:
+            return None
+        if job.fhir_id != fhir_id or time.monotonic() - job.created > self.ttl:
+            job.cancel()
+            return None
+        try:
+            try:
+                return job.future.result(timeout=timeout)
+            except TimeoutError:
+                if job.future.cancel():
+                    current_app.logger.debug(f"Prefetch for patient {fhir_id} never started; fetching in the foreground")
+                    return None
+                current_app.logger.debug(f"Prefetch for patient {fhir_id} still running after {timeout}s; waiting for it")
+            try:
+                return job.future.result(timeout=max(max_wait - timeout, 0))
+            except TimeoutError:
+                job.cancel()
+                raise PrefetchTimeout(f"Timed out after {max_wait}s waiting for patient data")
+        except (CancelledError, PrefetchCancelled):
+            current_app.logger.debug(f"Prefetch for patient {fhir_id} was cancelled")
+        except PrefetchTimeout:
+            raise
+        except Exception:
+            # The foreground request retries the whole chain and reports the error itself
+            current_app.logger.debug(f"Prefetch for patient {fhir_id} failed", exc_info=True)
+        return None
+
+    def _run(self, app, job, access_token):
+        with app.app_context():
+            job.check_cancelled()
+            fhir_client = FhirClient()
+            fhir_client.token = access_token
+            patient_context = fhir_client.get_patient_data_by_fhir_id(job.fhir_id)
+
+            job.check_cancelled()
+            articles = fetch_articles_for_patient(patient_context)
+            app.logger.debug(f"Prefetched patient {job.fhir_id} with {len(articles)} articles")
+            return patient_context, articles
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, job in list(self.jobs.items()):
+            if now - job.created > self.ttl:
+                job.cancel()
+                del self.jobs[key]
@@ -4,30 +4,46 @@ import time
 import sys  # Import sys to handle command-line arguments
 from dotenv import load_dotenv
 import os
+import logging
+import threading
+from collections import OrderedDict
 from utils.data_processing import load_emr_data
+from utils.literature_index import NO_ABSTRACT, NO_TITLE, get_literature_index
+import config
 
 load_dotenv()
 api_key = os.getenv('PUBMED_API_KEY')
 
-def fetch_pubmed_data(age, gender, medications=None, allergies=None, conditions=None, social_history=None, max_results=10):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    api_key = os.getenv('PUBMED_API_KEY')
+logger = logging.getLogger(__name__)
+
+PUBMED_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+# Articles already retrieved for a patient context, keyed by PatientContext.fingerprint
+_articles_by_fingerprint = OrderedDict()
+_articles_lock = threading.Lock()
 
+def fetch_pubmed_data(age, gender, medications=None, allergies=None, conditions=None, social_history=None, max_results=10):
     # Check if conditions are provided
     if not conditions:
         return None
+    if isinstance(conditions, (list, tuple)):
+        conditions = ', '.join(conditions)
 
-    # Constructing a query with gender and conditions
-    detailed_query = f"{gender} AND {conditions}"
-    encoded_query = requests.utils.quote(detailed_query)
+    # Answer from the local index when it covers the patient's conditions well enough
+    article_ids = search_literature_index(conditions, medications, max_results)
+    if article_ids:
+        return article_ids
 
-    search_url = f"{base_url}esearch.fcgi?db=pubmed&term={encoded_query}&retmax={max_results}&apikey={api_key}"
+    # Constructing a query with gender and conditions
+    detailed_query = f"{gender} AND {conditions}" if gender else conditions
+    params = {'db': 'pubmed', 'term': detailed_query, 'retmax': max_results}
+    if api_key:
+        params['api_key'] = api_key
 
-    print(f"Detailed Query: {detailed_query}")
-    print(f"Search URL: {search_url}")
+    logger.debug("PubMed esearch", extra={'query': detailed_query})
 
     try:
-        response = requests.get(search_url)
+        response = requests.get(f"{PUBMED_BASE_URL}esearch.fcgi", params=params)
         time.sleep(0.1)
         response.raise_for_status()
 
@@ -36,48 +52,194 @@ def fetch_pubmed_data(age, gender, medications=None, allergies=None, conditions=
             article_ids = [id_elem.text for id_elem in root.findall('.//IdList/Id')]
             return article_ids
         else:
-            print(f"Error: {response.status_code}")
+            logger.error(f"Error: {response.status_code}")
             return None
     except requests.exceptions.HTTPError as err:
-        print(f"HTTP error occurred: {err}")
+        logger.error(f"HTTP error occurred: {err}")
     except Exception as err:
-        print(f"An error occurred: {err}")
+        logger.error(f"An error occurred: {err}")
 
     return None
-    
+
+def search_literature_index(conditions, medications=None, max_results=10):
+    """
+    Ranks locally indexed PubMed articles against the patient's conditions and medications.
+    Only articles that themselves contain at least PUBMED_INDEX_MIN_COVERAGE of the condition
+    terms count as hits. Returns None when there are too few such hits, so the caller falls
+    back to NCBI.
+    """
+    index = get_literature_index()
+    if not len(index) or index.coverage(conditions) < config.PUBMED_INDEX_MIN_COVERAGE:
+        return None
+
+    query = conditions
+    if medications:
+        if isinstance(medications, (list, tuple)):
+            medications = ' '.join(medications)
+        query = f"{conditions} {medications}"
+    # BM25 matches any term, so only rank articles that are about the conditions
+    results = index.search(query, max_results=max_results, required=conditions,
+                           min_coverage=config.PUBMED_INDEX_MIN_COVERAGE)
+    article_ids = [pmid for pmid, _ in results]
+    if len(article_ids) < min(max_results, config.PUBMED_INDEX_MIN_HITS):
+        return None
+    return article_ids
+
+def fetch_articles_for_patient(patient_context):
+    """
+    Runs the PubMed search and article fetch for a PatientContext. Equivalent contexts
+    share a fingerprint, so repeat lookups are answered from memory.
+    """
+    fingerprint = patient_context.fingerprint
+    with _articles_lock:
+        if fingerprint in _articles_by_fingerprint:
+            _articles_by_fingerprint.move_to_end(fingerprint)
+            return _articles_by_fingerprint[fingerprint]
+
+    article_ids = fetch_pubmed_data(
+        age=patient_context.age,
+        gender=patient_context.gender,
+        medications=patient_context.medications,
+        allergies=patient_context.allergies,
+        conditions=patient_context.conditions,
+        social_history=patient_context.social_history
+    )
+    articles = fetch_article_details(article_ids) if article_ids else []
+    articles = articles or []
+
+    if articles:
+        with _articles_lock:
+            _articles_by_fingerprint[fingerprint] = articles
+            while len(_articles_by_fingerprint) > config.PUBMED_RESULT_CACHE_SIZE:
+                _articles_by_fingerprint.popitem(last=False)
+    return articles
+
 def fetch_article_details(article_ids):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    ids_string = ','.join(article_ids)
-    fetch_url = f"{base_url}efetch.fcgi?db=pubmed&id={ids_string}&retmode=xml&apikey={api_key}"
-    
+    # Serve already indexed articles locally and only fetch the rest from NCBI
+    index = get_literature_index()
+    cached = {pmid: index.get_article(pmid) for pmid in article_ids if pmid in index}
+    missing = [pmid for pmid in article_ids if pmid not in cached]
+    if not missing:
+        return [cached[pmid] for pmid in article_ids]
+
+    fetched = fetch_articles_from_ncbi(missing)
+    if fetched is None:
+        return [cached[pmid] for pmid in article_ids if pmid in cached] or None
+    if index.add_articles(fetched):
+        # Written to disk in the background, not on the request path
+        index.schedule_flush()
+
+    by_pmid = dict(cached)
+    by_pmid.update((article['pmid'], article) for article in fetched if article.get('pmid'))
+    articles = [by_pmid[pmid] for pmid in article_ids if pmid in by_pmid]
+    # Keep articles whose PMID could not be matched to the request
+    articles += [article for article in fetched if not article.get('pmid')]
+    return articles
+
+def fetch_articles_from_ncbi(article_ids):
+    """
+    Fetches article details from NCBI. Returns the articles parsed before any error,
+    or None if nothing could be fetched.
+    """
+    articles = []
     try:
-        response = requests.get(fetch_url)
+        for article in iter_article_details(article_ids):
+            articles.append(article)
+    except ET.ParseError as e:
+        logger.error(f"Error parsing XML: {e}")
+    except requests.exceptions.HTTPError as err:
+        logger.error(f"HTTP error occurred: {err}")
+    except Exception as err:
+        logger.error(f"An error occurred: {err}")
+    return articles or None
+
+def iter_article_details(article_ids, batch_size=None):
+    """
+    Yields article dicts as they are parsed from efetch.
+
+    Small ID lists are POSTed straight to efetch. Larger ones are uploaded once with
+    epost and fetched from the NCBI history server in chunks of batch_size.
+    """
+    batch_size = batch_size or config.PUBMED_EFETCH_BATCH_SIZE
+    article_ids = list(article_ids)
+    if not article_ids:
+        return
+
+    if len(article_ids) <= batch_size:
+        yield from stream_efetch({'id': ','.join(article_ids)})
+        return
+
+    for start in range(0, len(article_ids), config.PUBMED_EPOST_MAX_IDS):
+        chunk = article_ids[start:start + config.PUBMED_EPOST_MAX_IDS]
+        web_env, query_key = post_article_ids(chunk)
+        for retstart in range(0, len(chunk), batch_size):
+            yield from stream_efetch({
+                'WebEnv': web_env,
+                'query_key': query_key,
+                'retstart': retstart,
+                'retmax': batch_size,
+            })
+
+def post_article_ids(article_ids):
+    """Uploads PMIDs to the NCBI history server and returns (WebEnv, query_key)."""
+    data = {'db': 'pubmed', 'id': ','.join(article_ids)}
+    if api_key:
+        data['api_key'] = api_key
+    response = requests.post(f"{PUBMED_BASE_URL}epost.fcgi", data=data)
+    time.sleep(0.1)  # Adjusted rate limiting for 10 requests per second
+    response.raise_for_status()
+
+    root = ET.fromstring(response.content)
+    web_env = root.findtext('WebEnv')
+    query_key = root.findtext('QueryKey')
+    if not web_env or not query_key:
+        raise Exception(f"epost did not return a WebEnv: {root.findtext('.//ERROR')}")
+    return web_env, query_key
+
+def stream_efetch(params):
+    """POSTs an efetch request and parses PubmedArticle elements off the wire as they arrive."""
+    data = {'db': 'pubmed', 'retmode': 'xml'}
+    data.update(params)
+    if api_key:
+        data['api_key'] = api_key
+
+    with requests.post(f"{PUBMED_BASE_URL}efetch.fcgi", data=data, stream=True) as response:
         time.sleep(0.1)  # Adjusted rate limiting for 10 requests per second
         response.raise_for_status()
+        response.raw.decode_content = True
 
-        if response.status_code == 200:
-            try:
-                # Parse the XML response
-                root = ET.fromstring(response.content)
-                articles = []
-                for article in root.findall('.//PubmedArticle'):
-                    title = article.find('.//ArticleTitle').text
-                    abstract_element = article.find('.//Abstract/AbstractText')
-                    abstract = abstract_element.text if abstract_element is not None else "No abstract available"
-                    articles.append({'title': title, 'abstract': abstract})
-                return articles
-            except ET.ParseError as e:
-                print("Error parsing XML:", e)
-                return None
-        else:
-            print(f"Error: {response.status_code}")
-            return None
-    except requests.exceptions.HTTPError as err:
-        print(f"HTTP error occurred: {err}")
-    except Exception as err:
-        print(f"An error occurred: {err}")
+        root = None
+        for event, elem in ET.iterparse(response.raw, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == 'PubmedArticle':
+                yield parse_pubmed_article(elem)
+                # Drop parsed articles so memory stays bounded by a single article
+                root.clear()
 
-    return None
+def parse_pubmed_article(article):
+    pmid = article.findtext('MedlineCitation/PMID')
+    title_element = article.find('.//ArticleTitle')
+    title = element_text(title_element) or NO_TITLE
+
+    sections = []
+    for abstract_element in article.findall('.//Abstract/AbstractText'):
+        text = element_text(abstract_element)
+        if not text:
+            continue
+        label = abstract_element.get('Label')
+        sections.append(f"{label}: {text}" if label else text)
+    abstract = '\n'.join(sections) if sections else NO_ABSTRACT
+
+    return {'pmid': pmid, 'title': title, 'abstract': abstract}
+
+def element_text(element):
+    """Returns the full text of an element, including text inside inline markup such as <i>."""
+    if element is None:
+        return ''
+    return ''.join(element.itertext()).strip()
 
 if __name__ == "__main__":
     emr_data = load_emr_data('../data/mock_emr.csv')